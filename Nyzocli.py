@@ -6,35 +6,46 @@ EggdraSyl
 
 """
 
+import io
 import json
 import logging
+import signal
 # import pprint
+import socket
+import struct
 import sys
-from os import path
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext, redirect_stderr, redirect_stdout
+from decimal import Decimal
+from itertools import chain
+from os import chdir, environ, getcwd, path, remove, umask
 from time import time, sleep
-from typing import Tuple, Union
+from typing import Callable, Iterator, Tuple, Union
+
+from modules.rpc import SOCKET_ENV, default_socket_path, forward_command, local_command, read_message, rpc_call, \
+    write_message
+
+if __name__ == '__main__' and environ.get(SOCKET_ENV, ''):
+    # Thin client mode: hand the command over to a serve process, before loading anything else.
+    exit_code = forward_command(environ[SOCKET_ENV], sys.argv[1:])
+    if exit_code is not None:
+        sys.exit(exit_code)
 
 import click
 import re
-from nyzostrings.nyzostringencoder import NyzoStringEncoder
-# from nyzostrings.nyzostringsignature import NyzoStringSignature
-from nyzostrings.nyzostringprivateseed import NyzoStringPrivateSeed
-from nyzostrings.nyzostringtransaction import NyzoStringTransaction
-from nyzostrings.nyzostringpublicidentifier import NyzoStringPublicIdentifier
-from requests import get
-
-import pynyzo.config as config
+
+# Heavier pynyzo, nyzostrings and requests imports are done by the commands that need them.
 from modules.helpers import get_private_dir, extract_status_lines, \
-    fake_table_to_list, fake_table_frozen_to_dict
-from pynyzo.byteutil import ByteUtil
-from pynyzo.connection import Connection
-from pynyzo.keyutil import KeyUtil
-from pynyzo.message import Message
-from pynyzo.messageobject import EmptyMessageObject
-from pynyzo.messages.blockrequest import BlockRequest
-from pynyzo.messagetype import MessageType
-from pynyzo.transaction import Transaction
-from pynyzo.clienthelpers import NyzoClient
+    fake_table_to_list, fake_table_frozen_to_dict, fake_table_notices, micronyzos, read_payout_rows, read_token_rows, \
+    read_tx_rows, read_vote_rows, read_last_jsonl, find_balance_item
+from modules.checkpoint import default_checkpoint_path, read_checkpoint, write_checkpoint
+from modules.frozencache import read_frozen_cache, write_frozen_cache
+from modules.hedge import HedgedReader
+from modules.snapshot import BalanceSnapshot, default_snapshot_path, write_snapshot
+from modules.timings import Timings, append_jsonl, write_prometheus
+from modules.tokenmirror import TokenMirror, default_mirror_path
+from modules.verifier import VerifierPool, read_hosts
 
 
 __version__ = '0.0.12'
@@ -47,32 +58,148 @@ CYCLE_ADDRESS_HEX = "00000000000000000000000000000000000000000000000000000000000
 # CYCLE_ADDRESS_HEX = "a49138f27485cae4096c3eb72f9425943fe4b6f346d0fc76ef40084ec767365d"  # Debug
 
 def connect(ctx, verifier_ip):
-    """Tries to connect to the peer, depending on the context."""
+    """Tries to connect to the peer, depending on the context. Exits if it can't be reached.
+    Only checked once per verifier: later failures are raised by the requests, long running commands retry them."""
+    # Messages to the verifier are signed
+    load_keys()
     if verifier_ip == '':
         verifier_ip = ctx.obj['verifier_ip']
-    if ctx.obj.get('verifier_connection', None):
+    checked = ctx.obj.setdefault('verifiers_checked', set())
+    if verifier_ip in checked:
         return
     try:
-        connection = Connection(verifier_ip, 9444, verbose=ctx.obj['verbose'])
-        ctx.obj['verifier_connection'] = connection
+        get_verifier_pool(ctx).connect(verifier_ip)
     except Exception as e:
-        app_log.error(f"Error {e} connecting to {verifier_ip}:9444.")
-        sys.exit()
+        app_log.error(f"Error {e} connecting to {verifier_ip}.")
+        sys.exit(1)
+    checked.add(verifier_ip)
     return
 
 
-def reconnect(ctx):
-    """Should not be needed?"""
-    ctx.obj['verifier_connection'].close()
-    ctx.obj['verifier_connection'].sdef = None  # Temp hack for pynyzo version
-    ctx.obj['verifier_connection'].check_connection()
+def get_verifier_pool(ctx) -> VerifierPool:
+    """The verifier connections of all verifier commands, created on first use.
+    A serve process keeps its own across commands."""
+    if not ctx.obj.get('verifier_pool', None):
+        ctx.obj['verifier_pool'] = VerifierPool()
+        ctx.call_on_close(ctx.obj['verifier_pool'].close)
+    # The serve one outlives the commands, its phases go to the current one
+    ctx.obj['verifier_pool'].timer = obj_timer(ctx.obj)
+    return ctx.obj['verifier_pool']
+
+
+def verifier_fetch(ctx, message) -> bytes:
+    """Sends a pynyzo Message to the context verifier, returns the raw answer"""
+    return get_verifier_pool(ctx).exchange(ctx.obj['verifier_ip'], message.get_bytes_for_transmission())
+
+
+def verifier_request(ctx, message):
+    """Sends a pynyzo Message to the context verifier, returns the decoded answer content"""
+    from pynyzo.message import Message
+    return Message.from_bytes(verifier_fetch(ctx, message), b'').get_content()
+
+
+def timed(ctx, phase: str):
+    """Context manager timing a phase of the command when --timings is on, does nothing otherwise"""
+    timings = ctx.obj.get('timings', None)
+    return timings.phase(phase) if timings else nullcontext()
+
+
+def obj_timer(obj: dict):
+    """Same as timed, over a context obj: for what outlives a single command, like the serve verifier pool"""
+    return lambda phase: obj['timings'].phase(phase) if obj.get('timings', None) else nullcontext()
+
+
+def report_timings(ctx) -> None:
+    """Reports the phase timings once the command is done: stderr, JSONL log and/or Prometheus textfile"""
+    report = ctx.obj['timings'].report()
+    command = ctx.obj['command']
+    if ctx.obj['timings_log']:
+        append_jsonl(ctx.obj['timings_log'], {"command": command, "timestamp": round(time(), 3), **report})
+    if ctx.obj['timings_prom']:
+        write_prometheus(ctx.obj['timings_prom'], command, report)
+    if ctx.obj['show_timings']:
+        # stderr, so that json answers on stdout stay parseable
+        if ctx.obj['json']:
+            print(json.dumps({"timings": {"command": command, **report}}), file=sys.stderr)
+        else:
+            print(f"Timings for {command}:\n{ctx.obj['timings'].to_text()}", file=sys.stderr)
+
+
+def get_http(ctx):
+    """The keep-alive http transport for all client and token API calls, created on first use.
+    A serve process keeps its own across commands, a command with other --timeout or --retries gets a new one."""
+    http = ctx.obj.get('http', None)
+    if not http or (http.timeout, http.retries) != (ctx.obj['timeout'], ctx.obj['retries']):
+        from modules.transport import HttpTransport
+        ctx.obj['http'] = HttpTransport(timeout=ctx.obj['timeout'], retries=ctx.obj['retries'])
+        ctx.call_on_close(ctx.obj['http'].close)
+    return ctx.obj['http']
+
+
+def get_client_reader(ctx) -> HedgedReader:
+    """Hedged reads over the context clients, created on first use. Latencies are saved once the command is done."""
+    if not ctx.obj.get('client_reader', None) or ctx.obj['client_reader'].endpoints != ctx.obj['clients']:
+        ctx.obj['client_reader'] = HedgedReader(ctx.obj['clients'], get_http(ctx).get,
+                                                failure_latency=ctx.obj['timeout'],
+                                                stats_file=path.join(get_private_dir(), "client_latency.json"))
+    return ctx.obj['client_reader']
+
+
+def client_read(ctx, path_query: str):
+    """Idempotent GET on the clients, hedged when there are several. Returns the response."""
+    if len(ctx.obj['clients']) == 1:
+        # No thread, no latency stats
+        return get_http(ctx).get(ctx.obj['clients'][0] + path_query)
+    endpoint, res = get_client_reader(ctx).get(path_query)
+    if VERBOSE and len(ctx.obj['clients']) > 1:
+        app_log.info(f"Answer from {endpoint}")
+    return res
+
+
+def get_nyzo_client(ctx):
+    """pynyzo NyzoClient for the context client, shares the context http transport"""
+    from modules.transport import bind_nyzo_client
+    # Module level, may have been bound to the transport of a previous serve command
+    bind_nyzo_client(get_http(ctx))
+    if not ctx.obj.get('nyzo_client', None) or ctx.obj['nyzo_client'].client != ctx.obj['client']:
+        from pynyzo.clienthelpers import NyzoClient
+        ctx.obj['nyzo_client'] = NyzoClient(ctx.obj['client'])
+    return ctx.obj['nyzo_client']
+
+
+def load_keys():
+    """Loads the wallet keys from the user private dir - or creates them - the first time they are needed.
+    Returns the pynyzo config module, that holds them."""
+    import pynyzo.config as config
+    if isinstance(config.PUBLIC_KEY, bytes):
+        # Use user private dir
+        private_dir = get_private_dir()
+        config.NYZO_SEED = private_dir + '/private_seed'
+        config.load(private_dir)
+        if VERBOSE:
+            from pynyzo.byteutil import ByteUtil
+            app_log.info(f"Key Loaded, public id {ByteUtil.bytes_as_string_with_dashes(config.PUBLIC_KEY.to_bytes())}")
+    return config
+
+
+def seed_from_key(key_: str="") -> bytes:
+    """Private seed from a key_ nyzostring, or from the wallet if empty"""
+    if key_ == "":
+        return load_keys().PRIVATE_KEY.to_bytes()
+    from nyzostrings.nyzostringencoder import NyzoStringEncoder
+    return NyzoStringEncoder.decode(key_).get_bytes()
+
+
+def wallet_address() -> str:
+    """Wallet public address, as hex"""
+    return load_keys().PUBLIC_KEY.to_bytes().hex()
 
 
 @click.group()
 @click.option('--verifier_ip', '-i', default="127.0.0.1",
               help='Set a specific verifier ip (default=localhost)')
 @click.option('--client', '-c', default="https://client.nyzo.co",
-              help='Set a specific client (default=https://client.nyzo.co)')
+              help='Set a specific client, or several comma separated for hedged reads (default=https://client.nyzo.co)')
 @click.option('--token', '-t', default="https://tokens.nyzo.today/api",
               help='Set a specific token API (default=https://tokens.nyzo.today/api)')
 @click.option('--port', '-p', default=80, help='Client port (default 80)')
@@ -81,23 +208,51 @@ def reconnect(ctx):
               help='Try to always answer with json (default false)')
 @click.option('--verbose', '-v', is_flag=True, default=False,
               help='Be verbose! (default false)')
+@click.option('--timeout', default=30.0, help='HTTP timeout in seconds (default 30)')
+@click.option('--retries', default=3, help='HTTP retries, with backoff (default 3)')
+@click.option('--frozen_max_age', default=60.0,
+              help='Max age in seconds of the cached frozen edge used to sign tx (default 60)')
+@click.option('--no-cache', 'no_cache', is_flag=True, default=False,
+              help='Do not use nor update the on-disk frozen edge cache (default false)')
+@click.option('--timings', 'show_timings', is_flag=True, default=False,
+              help='Print the time spent in each phase (connect, fetch, sign, forward...) to stderr (default false)')
+@click.option('--timings_log', default='', help='Also append the phase timings as a json line to that file')
+@click.option('--timings_prom', default='',
+              help='Also write the phase timings to that Prometheus textfile (node_exporter textfile collector)')
 @click.pass_context
-def cli(ctx, verifier_ip, client, token, port, unlock, verbose, json):
+def cli(ctx, verifier_ip, client, token, port, unlock, verbose, json, timeout, retries, frozen_max_age, no_cache,
+        show_timings, timings_log, timings_prom):
     global VERBOSE
     # ctx.obj['host'] = host
     # ctx.obj['port'] = port
     ctx.obj['verifier_ip'] = verifier_ip
-    ctx.obj['client'] = client
+    # Reads (frozen edge, balance) are hedged over all clients, the rest goes to the first one.
+    ctx.obj['clients'] = [item.strip() for item in client.split(",") if item.strip()]
+    ctx.obj['client'] = ctx.obj['clients'][0]
     ctx.obj['token'] = token
     ctx.obj['port'] = port
     ctx.obj['unlock'] = unlock
     ctx.obj['json'] = json
     ctx.obj['verbose'] = verbose
+    ctx.obj['frozen_max_age'] = frozen_max_age
+    ctx.obj['frozen_cache'] = not no_cache
+    ctx.obj['timeout'] = timeout
+    ctx.obj['retries'] = retries
     VERBOSE = verbose
-    ctx.obj['verifier_connection'] = None
+    if not verbose:
+        # http retries are logged as warnings, noise next to the results
+        logging.getLogger("urllib3").setLevel(logging.ERROR)
     ctx.obj['client_connection'] = None
-    if VERBOSE:
-        app_log.info(f"Key Loaded, public id {ByteUtil.bytes_as_string_with_dashes(config.PUBLIC_KEY.to_bytes())}")
+    # Also for serve commands, that share the reader
+    ctx.call_on_close(lambda: ctx.obj.get('client_reader', None) and ctx.obj['client_reader'].save())
+    ctx.obj['timings'] = None
+    if show_timings or timings_log or timings_prom:
+        ctx.obj['timings'] = Timings()
+        ctx.obj['command'] = ctx.invoked_subcommand
+        ctx.obj['show_timings'] = show_timings
+        ctx.obj['timings_log'] = timings_log
+        ctx.obj['timings_prom'] = timings_prom
+        ctx.call_on_close(lambda: report_timings(ctx))
 
 
 @cli.command()
@@ -106,7 +261,7 @@ def version(ctx):
     """Print version"""
     if ctx.obj['json']:
         print(json.dumps({"version": __version__,
-                          "private_dir": get_private_dir}))
+                          "private_dir": get_private_dir()}))
     else:
         print(f"Nyzocli version {__version__} - "
               f"Your private dir is {get_private_dir()}")
@@ -116,6 +271,8 @@ def version(ctx):
 @click.pass_context
 def info(ctx):
     """Print version and more info"""
+    from pynyzo.byteutil import ByteUtil
+    config = load_keys()
     if ctx.obj['json']:
         print(json.dumps({"version": __version__,
                           "private_dir": get_private_dir(),
@@ -136,6 +293,9 @@ def info(ctx):
 @click.argument('block_number', type=int)
 def block(ctx, block_number):
     """Get a block detail"""
+    from pynyzo.message import Message
+    from pynyzo.messages.blockrequest import BlockRequest
+    from pynyzo.messagetype import MessageType
     connect(ctx, ctx.obj['verifier_ip'])
     if VERBOSE:
         app_log.info(f"Connected to {ctx.obj['verifier_ip']}:9444")
@@ -143,10 +303,305 @@ def block(ctx, block_number):
     req = BlockRequest(start_height=block_number, end_height=block_number,
                        include_balance_list=False, app_log=app_log)
     message = Message(MessageType.BlockRequest11, req, app_log=app_log)
-    res = ctx.obj['verifier_connection'].fetch(message)
+    with timed(ctx, "block_fetch"):
+        res = verifier_request(ctx, message)
     print(res.to_json())
 
 
+# Adaptive chunking bounds for block ranges
+BLOCKS_TARGET_LATENCY = 1.0  # seconds per request
+BLOCKS_MAX_RESPONSE = 3 * 1024 * 1024  # bytes, leaves room under the 4MB max message length
+
+
+def fetch_blocks(ctx, start_height: int, end_height: int) -> Tuple[list, int]:
+    """Fetch a block range with one BlockRequest11, returns the blocks and the raw response size"""
+    from pynyzo.message import Message
+    from pynyzo.messages.blockrequest import BlockRequest
+    from pynyzo.messagetype import MessageType
+    req = BlockRequest(start_height=start_height, end_height=end_height,
+                       include_balance_list=False, app_log=app_log)
+    message = Message(MessageType.BlockRequest11, req, app_log=app_log)
+    with timed(ctx, "block_fetch"):
+        buffer = verifier_fetch(ctx, message)
+    if not buffer:
+        raise RuntimeError(f"No answer for blocks {start_height}-{end_height}")
+    # pynyzo BlockResponse prints debug info, keep stdout for the blocks.
+    with redirect_stdout(sys.stderr), timed(ctx, "block_decode"):
+        res = Message.from_bytes(buffer, b'').get_content()
+    return res.get_blocks(), len(buffer)
+
+
+@cli.command()
+@click.pass_context
+@click.argument('start', type=int)
+@click.argument('end', type=int)
+@click.option('--output', '-o', default='', help='JSONL file to append to, resumes after its last block (default stdout)')
+@click.option('--chunk', default=10, help='Initial number of blocks per request, adapts afterward (default 10)')
+@click.option('--max_chunk', default=1000, help='Max number of blocks per request (default 1000)')
+def blocks(ctx, start, end, output, chunk, max_chunk):
+    """Stream blocks from START to END (included), one JSON line per block.
+    Blocks are written as they arrive. The request size adapts to the verifier answers size and latency.
+    - ex: python3 Nyzocli.py -i verifier0.nyzo.co blocks 1696000 1697000 -o blocks.jsonl
+    """
+    import pynyzo.config as config
+    if output:
+        last = read_last_jsonl(output)
+        if last:
+            start = max(start, last["value"]["height"] + 1)
+            if VERBOSE:
+                app_log.info(f"Resuming from block {start}")
+        fp = open(output, "a")
+    else:
+        fp = sys.stdout
+    if not VERBOSE:
+        # pynyzo traces would mix with the blocks
+        config.VERBOSE = False
+    connect(ctx, ctx.obj['verifier_ip'])
+    height = start
+    try:
+        while height <= end:
+            asked = min(chunk, end - height + 1)
+            start_time = time()
+            blocks, size = fetch_blocks(ctx, height, height + asked - 1)
+            latency = time() - start_time
+            if not blocks:
+                raise RuntimeError(f"Verifier has no block from {height}")
+            for block in blocks:
+                fp.write(block.to_json() + "\n")
+            fp.flush()
+            height += len(blocks)
+            if VERBOSE:
+                app_log.info(f"Got {len(blocks)} blocks up to {height - 1}, {size} bytes in {latency:0.2f} sec.")
+            # Adapt the next chunk
+            per_block = size / len(blocks)
+            if len(blocks) < asked:
+                # Verifier side limit
+                chunk = len(blocks)
+            elif latency < BLOCKS_TARGET_LATENCY and per_block * chunk * 2 < BLOCKS_MAX_RESPONSE:
+                chunk = min(chunk * 2, max_chunk)
+            elif latency > 2 * BLOCKS_TARGET_LATENCY or per_block * chunk > BLOCKS_MAX_RESPONSE:
+                chunk = max(chunk // 2, 1)
+    except Exception as e:
+        app_log.error(f"Error {e} at block {height}, run again to resume.")
+        # Output stops short of END: make it visible to scripts
+        sys.exit(1)
+    finally:
+        if output:
+            fp.close()
+
+
+def blocks_from_response(buffer: bytes) -> list:
+    """Blocks of a raw BlockResponse12 message buffer.
+    Same decoding as pynyzo BlockResponse, without its debug print, so it can run from several threads."""
+    from pynyzo.balancelist import BalanceList
+    from pynyzo.block import Block
+    view = memoryview(buffer)
+    offset = 10  # timestamp and type
+    has_balance_list = buffer[offset]
+    offset += 1
+    if has_balance_list:
+        offset += BalanceList(buffer=view[offset:]).get_byte_size()
+    number_of_blocks = struct.unpack(">H", buffer[offset:offset + 2])[0]
+    offset += 2
+    blocks = []
+    for i in range(number_of_blocks):
+        block = Block(buffer=view[offset:])
+        offset += block.get_byte_size(include_signature=True)
+        blocks.append(block)
+    return blocks
+
+
+def scan_range(pool: VerifierPool, hosts: list, first: int, start: int, end: int, identifiers: set,
+               timeout: float) -> dict:
+    """Matching transactions of the blocks START to END, from the verifier hosts[first].
+    Goes on with the next verifiers on errors, each one being tried once. Never raises."""
+    from pynyzo.message import Message
+    from pynyzo.messages.blockrequest import BlockRequest
+    from pynyzo.messagetype import MessageType
+    result = {"start": start, "end": end, "blocks": 0, "transactions": 0, "matches": []}
+    height = start
+    tries = 0
+    host = hosts[first % len(hosts)]
+    while height <= end:
+        host = hosts[(first + tries) % len(hosts)]
+        try:
+            req = BlockRequest(start_height=height, end_height=end, include_balance_list=False, app_log=app_log)
+            message = Message(MessageType.BlockRequest11, req, app_log=app_log)
+            blocks = blocks_from_response(pool.exchange(host, message.get_bytes_for_transmission(), timeout))
+            if not blocks:
+                raise RuntimeError(f"No block from {height}")
+        except Exception as e:
+            tries += 1
+            if tries >= len(hosts):
+                result["error"] = f"{host}: {e.__class__.__name__}: {e}"
+                result["end"] = height - 1
+                break
+            continue
+        for block in blocks:
+            # pynyzo Block has no getters for these
+            block_height = block._height
+            for transaction in block._transactions:
+                result["transactions"] += 1
+                matched = [side for side, identifier in (("sender", transaction.get_sender_identifier()),
+                                                         ("receiver", transaction.get_receiver_identifier()))
+                           if bytes(identifier) in identifiers]
+                if matched:
+                    result["matches"].append({"height": block_height, "matched": matched,
+                                              **json.loads(transaction.to_json())["value"]})
+        result["blocks"] += len(blocks)
+        height = block_height + 1
+    result["host"] = host
+    return result
+
+
+@cli.command()
+@click.pass_context
+@click.argument('start', type=int)
+@click.argument('end', type=int)
+@click.option('--addresses', '-a', 'address_file', type=click.File('r'), required=True,
+              help='Addresses to look for, one a line (hex or id__). Use - for stdin')
+@click.option('--verifier', '-V', 'hosts', multiple=True,
+              help='Verifier to ask, ip or ip:port. Repeat for several (default: -i, that can be a comma separated list)')
+@click.option('--workers', '-w', default=4, help='Concurrent requests per verifier (default 4)')
+@click.option('--chunk', default=100, help='Blocks per task (default 100)')
+@click.option('--host_timeout', default=30.0, help='Seconds allowed to each request (default 30)')
+@click.option('--output', '-o', type=click.File('a'), default='-', help='JSONL output (default stdout)')
+def scan(ctx, start, end, address_file, hosts, workers, chunk, host_timeout, output):
+    """Find every transaction from or to a set of addresses, in blocks START to END (included).
+    The range is split among the verifiers, matching transactions are printed as JSON lines in block order,
+    then a summary line. Ranges no verifier could answer are listed in the summary and on stderr, the exit code is 1.
+    - ex: python3 Nyzocli.py scan 10200000 10570000 -a deposits.txt -V 1.2.3.4 -V 5.6.7.8 -o activity.jsonl
+    - ex: python3 Nyzocli.py -i 1.2.3.4,5.6.7.8 scan 10200000 10570000 -a deposits.txt
+    """
+    config = load_keys()
+    if not VERBOSE:
+        # pynyzo warns about every unvalidated message, that would mess the json lines
+        config.VERBOSE = False
+    hosts = read_hosts(hosts) or read_hosts(ctx.obj['verifier_ip'].split(','))
+    # Raw identifiers, normalized once
+    identifiers = set()
+    for address in read_hosts(address_file):
+        identifiers.add(normalize_address(address)[1])
+    pool = get_verifier_pool(ctx)
+    begin = time()
+    totals = {"blocks": 0, "transactions": 0, "matches": 0}
+    missing = []
+    pending = deque()
+    max_pending = 2 * workers * len(hosts)
+
+    def write(future: Future) -> None:
+        result = future.result()
+        for match in result["matches"]:
+            output.write(json.dumps(match) + "\n")
+        output.flush()
+        for key in ("blocks", "transactions"):
+            totals[key] += result[key]
+        totals["matches"] += len(result["matches"])
+        if "error" in result:
+            missing.append({"start": result["end"] + 1, "end": end_of_task(result["start"]),
+                            "error": result["error"]})
+        if VERBOSE:
+            app_log.info(f"Blocks {result['start']}-{result['end']} from {result['host']}: "
+                         f"{len(result['matches'])} matches")
+
+    def end_of_task(task_start: int) -> int:
+        return min(task_start + chunk - 1, end)
+
+    with ThreadPoolExecutor(max_workers=workers * len(hosts)) as executor, timed(ctx, "scan"):
+        for index, task_start in enumerate(range(start, end + 1, chunk)):
+            pending.append(executor.submit(scan_range, pool, hosts, index, task_start, end_of_task(task_start),
+                                           identifiers, host_timeout))
+            while len(pending) >= max_pending:
+                write(pending.popleft())
+        while pending:
+            write(pending.popleft())
+    output.write(json.dumps({"summary": {"start": start, "end": end, "addresses": len(identifiers), **totals,
+                                         "missing": missing, "elapsed": round(time() - begin, 3)}}) + "\n")
+    output.flush()
+    if missing:
+        for item in missing:
+            print(json.dumps({"missing": item}), file=sys.stderr)
+        sys.exit(1)
+
+
+@cli.command()
+@click.pass_context
+@click.option('--output', '-o', default='', help='JSONL file to append to (default stdout)')
+@click.option('--checkpoint', default='', help='Checkpoint file (default: follow_checkpoint.json in private dir)')
+@click.option('--start', default=0, help='First block to send when there is no checkpoint yet (default: the frozen edge)')
+@click.option('--max_chunk', default=100, help='Max number of blocks per request when catching up (default 100)')
+@click.option('--min_interval', default=1.0, help='Min seconds between frozen edge polls (default 1)')
+@click.option('--max_interval', default=15.0, help='Max seconds between frozen edge polls (default 15)')
+@click.option('--blocks', 'max_blocks', default=0, help='Stop after that many blocks (default 0, never)')
+def follow(ctx, output, checkpoint, start, max_chunk, min_interval, max_interval, max_blocks):
+    """Stream newly frozen blocks as they come, one JSON line per block.
+    The last sent height is saved to a checkpoint file, a restart goes on from the next block.
+    With --output, the last block of the file is also taken into account, so a crash never sends a block twice.
+    - ex: python3 Nyzocli.py -i verifier0.nyzo.co follow -o blocks.jsonl
+    - ex: python3 Nyzocli.py -i verifier0.nyzo.co follow --start 10228000 | ./indexer.py
+    """
+    checkpoint = checkpoint or default_checkpoint_path("follow")
+    height = 0
+    saved = read_checkpoint(checkpoint)
+    if saved:
+        height = saved["height"] + 1
+    if output:
+        last = read_last_jsonl(output)
+        if last:
+            height = max(height, last["value"]["height"] + 1)
+        fp = open(output, "a")
+    else:
+        fp = sys.stdout
+    if not height:
+        height = start
+    if height and VERBOSE:
+        app_log.info(f"Following from block {height}")
+    config = load_keys()
+    if not VERBOSE:
+        # pynyzo traces would mix with the blocks
+        config.VERBOSE = False
+    sent = 0
+    misses = 0
+    try:
+        while True:
+            try:
+                frozen = fetch_frozen_height(ctx)
+                if not height:
+                    height = frozen
+                advanced = frozen >= height
+                timestamp = None
+                while height <= frozen:
+                    end = min(frozen, height + max_chunk - 1)
+                    if max_blocks:
+                        end = min(end, height + max_blocks - sent - 1)
+                    blocks, _ = fetch_blocks(ctx, height, end)
+                    if not blocks:
+                        raise RuntimeError(f"Verifier has no block from {height}")
+                    lines = [block.to_json() for block in blocks]
+                    fp.write("\n".join(lines) + "\n")
+                    fp.flush()
+                    height += len(blocks)
+                    sent += len(blocks)
+                    # Only once the blocks are out
+                    write_checkpoint(checkpoint, {"height": height - 1, "verifier": ctx.obj['verifier_ip']})
+                    timestamp = json.loads(lines[-1])["value"]["verification_timestamp"]
+                    if VERBOSE:
+                        app_log.info(f"Sent blocks up to {height - 1}, frozen edge {frozen}")
+                    if max_blocks and sent >= max_blocks:
+                        return
+                misses = 0 if advanced else misses + 1
+                delay = next_poll_delay(timestamp, advanced, misses, min_interval, max_interval)
+            except Exception as e:
+                # Never on stdout, that only carries blocks
+                print(json.dumps({"event": "error", "block": height, "error": str(e), "retry_in": max_interval}),
+                      file=sys.stderr, flush=True)
+                delay = max_interval
+            sleep(delay)
+    finally:
+        if output:
+            fp.close()
+
+
 @cli.command()
 @click.pass_context
 @click.argument('address', default='', type=str)
@@ -154,25 +609,14 @@ def balance(ctx, address):
     """Get balance of an ADDRESS from nyzo client
     """
     if address == '':
-        address = config.PUBLIC_KEY.to_bytes().hex()
+        address = wallet_address()
     id__address, address = normalize_address(address, asHex=True)
     if VERBOSE:
         app_log.info(f"Get balance for address {address}")
     assert(len(address) == 64)  # TODO: better user warning
 
-    url = "{}/balance?walletId={}&action=run".format(ctx.obj['client'], address)
-    if VERBOSE:
-        app_log.info(f"Calling {url}")
-    res = get(url)
-    if VERBOSE:
-        app_log.info(res)
-    if path.isdir("tmp"):
-        # Store for debug purposes
-        with open("tmp/answer.txt", "w") as fp:
-            fp.write(res.text)
-    # print(json.dumps(fake_table_to_list(res.text)))
     try:
-        data = list(fake_table_to_list(res.text))[0]
+        data = fetch_client_balance(ctx, address)
         balance = data["balance"].replace("\u2229", "")
         if ctx.obj['json']:
             print(json.dumps({"block": data["block height"], "balance": balance,
@@ -193,87 +637,268 @@ def balance(ctx, address):
         return 0
 
 
-@cli.command()
-@click.pass_context
-@click.argument('address', default='', type=str)
-def vbalance(ctx, address):
-    """Get balance of an ADDRESS from a verifier (Uses the one from localhost by default)
-    """
-    connect(ctx, ctx.obj['verifier_ip'])
-    if address == '':
-        address = config.PUBLIC_KEY.to_bytes().hex()
-    else:
-        id__address, address = normalize_address(address, asHex=True)
-
+def fetch_client_balance(ctx, address: str) -> dict:
+    """Balance row of a hex address from the client, {"block height": ..., "balance": "∩..."}.
+    Raises if the client has no balance for it."""
+    query = "/balance?walletId={}&action=run".format(address)
     if VERBOSE:
-        app_log.info(f"Get vbalance for address {address}")
-    assert(len(address) == 64)  # TODO: better user warning
+        app_log.info(f"Calling {query} on {ctx.obj['clients']}")
+    with timed(ctx, "balance_fetch"):
+        res = client_read(ctx, query)
+    if VERBOSE:
+        app_log.info(res)
+    if path.isdir("tmp"):
+        # Store for debug purposes
+        with open("tmp/answer.txt", "w") as fp:
+            fp.write(res.text)
+    return list(fake_table_to_list(res.text))[0]
+
 
+def fetch_frozen_height(ctx) -> int:
+    """Frozen edge height from the verifier status"""
+    from pynyzo.message import Message
+    from pynyzo.messageobject import EmptyMessageObject
+    from pynyzo.messagetype import MessageType
+    connect(ctx, ctx.obj['verifier_ip'])
     if VERBOSE:
         app_log.info(f"Connected to {ctx.obj['verifier_ip']}")
-        app_log.info(f"address {address}")
     empty = EmptyMessageObject()
     message = Message(MessageType.StatusRequest17, empty, app_log=app_log)
-    res = ctx.obj['verifier_connection'].fetch(message)
+    with timed(ctx, "status_fetch"):
+        res = verifier_request(ctx, message)
     status = res.get_lines()
     frozen = int(extract_status_lines(status, "frozen edge")[0])
     if VERBOSE:
         app_log.info(f"Frozen Edge: {frozen}")
+    return frozen
+
 
-    reconnect(ctx)
+def fetch_frozen_balance_list(ctx) -> tuple:
+    """Gets the frozen edge height from the verifier status, then the balance list at that height"""
+    frozen = fetch_frozen_height(ctx)
+    return frozen, fetch_balance_list(ctx, frozen)
 
+
+def fetch_balance_list(ctx, frozen: int):
+    """Balance list at a given height, from the connected verifier"""
+    from pynyzo.message import Message
+    from pynyzo.messages.blockrequest import BlockRequest
+    from pynyzo.messagetype import MessageType
     req = BlockRequest(start_height=frozen, end_height=frozen,
                        include_balance_list=True, app_log=app_log)
     message2 = Message(MessageType.BlockRequest11, req, app_log=app_log)
-    res = ctx.obj['verifier_connection'].fetch(message2)
-    # Wow, this is quite heavy. move some logic the pynyzo
-    # Also list is *supposed* to be sorted, can help find faster
-    bin_address = bytes.fromhex(address)
-    for item in res.get_initial_balance_list().get_items():
-        if item.get_identifier() == bin_address:
-            if ctx.obj['json']:
-                print(json.dumps({"block": frozen, "balance":item.get_balance(),
-                                  "blocks_until_fee": item.get_blocks_until_fee(),
-                                  "address": address}))
-            else:
-                print(f"At block: {frozen}")
-                print(f"Your Balance is: {item.get_balance()/1000000}")
-                print(f"Blocks until fee: {item.get_blocks_until_fee()}")
-            return (item.get_balance(), item.get_blocks_until_fee())
+    with timed(ctx, "balance_list_download"):
+        buffer = verifier_fetch(ctx, message2)
+    # pynyzo BlockResponse prints debug info, keep stdout for the answers.
+    with redirect_stdout(sys.stderr), timed(ctx, "balance_list_decode"):
+        res = Message.from_bytes(buffer, b'').get_content()
+    return res.get_initial_balance_list()
 
-    # Address Not found
-    if ctx.obj['json']:
-        print(json.dumps({"block": frozen, "balance": 0,
-                          "blocks_until_fee": None, "address": address}))
+
+@cli.command()
+@click.pass_context
+@click.argument('addresses', nargs=-1, type=str)
+@click.option('--file', '-f', 'address_file', type=click.File('r'), default=None,
+              help='Also read addresses from that file, one a line. Use - for stdin')
+@click.option('--snapshot', '-s', 'use_snapshot', is_flag=True, default=False,
+              help='Answer from the local balance snapshot (see snapshot command), no network')
+@click.option('--snapshot_file', default='', help='Snapshot file to use (default: the one in private dir)')
+def vbalance(ctx, addresses, address_file, use_snapshot, snapshot_file):
+    """Get balance of ADDRESSES from a verifier (Uses the one from localhost by default)
+    The balance list is fetched once. With several addresses, answers with one JSON line per address.
+    - ex: python3 Nyzocli.py vbalance
+    - ex: python3 Nyzocli.py vbalance abd7fede35a84b10-8a36e6dc361d9b32-ca84d149f6eb85b4-a4e63015278d4c9f id__...
+    - ex: cat addresses.txt | python3 Nyzocli.py vbalance -f -
+    - ex: python3 Nyzocli.py vbalance --snapshot -f addresses.txt
+    """
+    human = len(addresses) <= 1 and address_file is None and not ctx.obj['json']
+    if len(addresses) == 0 and address_file is None:
+        addresses = (wallet_address(), )
+    if address_file is not None:
+        addresses = chain(addresses, (line.strip() for line in address_file if line.strip()))
+
+    if use_snapshot or snapshot_file:
+        snapshot = BalanceSnapshot(snapshot_file or default_snapshot_path())
+        ctx.call_on_close(snapshot.close)
+        frozen, find = snapshot.height, snapshot.find
     else:
-        print(f"At block: {frozen}")
-        print(f"Your Balance is: N/A")
-        print(f"Blocks until fee: N/A")
-    return 0, 0
+        frozen, balance_list = fetch_frozen_balance_list(ctx)
+        items = balance_list.get_items()
+
+        def find(identifier: bytes):
+            with timed(ctx, "balance_scan"):
+                item = find_balance_item(items, identifier)
+            return None if item is None else (item.get_balance(), item.get_blocks_until_fee())
+    result = (0, 0)
+    for address in addresses:
+        try:
+            _, address = normalize_address(address, asHex=True)
+        except ValueError as e:
+            print(json.dumps({"block": frozen, "address": address, "error": str(e)}))
+            continue
+        if VERBOSE:
+            app_log.info(f"Get vbalance for address {address}")
+        found = find(bytes.fromhex(address))
+        if found is None:
+            # Address Not found
+            result = (0, 0)
+            if human:
+                print(f"At block: {frozen}")
+                print(f"Your Balance is: N/A")
+                print(f"Blocks until fee: N/A")
+            else:
+                print(json.dumps({"block": frozen, "balance": 0,
+                                  "blocks_until_fee": None, "address": address}))
+            continue
+        result = found
+        if human:
+            print(f"At block: {frozen}")
+            print(f"Your Balance is: {found[0]/1000000}")
+            print(f"Blocks until fee: {found[1]}")
+        else:
+            print(json.dumps({"block": frozen, "balance": found[0],
+                              "blocks_until_fee": found[1],
+                              "address": address}))
+    return result
 
 
 @cli.command()
 @click.pass_context
-def status(ctx):
-    """Get Status of distant server"""
-    # ex : python3 Nyzocli.py  -j status 159.69.216.65
-    connect(ctx, ctx.obj['verifier_ip'])
-    if VERBOSE:
-        app_log.info(f"Connected to {ctx.obj['verifier_ip']}")
-    empty = EmptyMessageObject(app_log=app_log)
-    message = Message(MessageType.StatusRequest17, empty, app_log=app_log)
-    res = ctx.obj['verifier_connection'].fetch(message)
-    print(res.to_json())
-    # print(json.dumps(status))
+@click.option('--output', '-o', default='', help='Snapshot file to write (default: the one in private dir)')
+def snapshot(ctx, output):
+    """Save the frozen edge balance list from the verifier as a compact local snapshot,
+    for offline lookups with vbalance --snapshot
+    - ex: python3 Nyzocli.py -i verifier0.nyzo.co snapshot
+    """
+    frozen, balance_list = fetch_frozen_balance_list(ctx)
+    file_name = output or default_snapshot_path()
+    with timed(ctx, "snapshot_write"):
+        count = write_snapshot(file_name, frozen, balance_list.get_items())
+    if ctx.obj['json']:
+        print(json.dumps({"block": frozen, "count": count, "file": file_name}))
+    else:
+        print(f"Saved {count} balances at block {frozen} into {file_name}")
+
+
+def status_lines_to_dict(lines: list) -> dict:
+    """"key: value" status lines as a dict"""
+    values = {}
+    for line in lines:
+        key, separator, value = line.partition(':')
+        if separator:
+            values[key.strip()] = value.strip()
+    return values
+
+
+def fetch_host_status(pool: VerifierPool, host: str, timeout: float) -> dict:
+    """Status of a single verifier, as a dict. Never raises, errors are reported in the result."""
+    from pynyzo.message import Message
+    from pynyzo.messageobject import EmptyMessageObject
+    from pynyzo.messagetype import MessageType
+    result = {"host": host}
+    start = time()
+    try:
+        empty = EmptyMessageObject(app_log=app_log)
+        message = Message(MessageType.StatusRequest17, empty, app_log=app_log)
+        buffer = pool.exchange(host, message.get_bytes_for_transmission(), timeout)
+        lines = Message.from_bytes(buffer, b'').get_content().get_lines()
+        result["ok"] = True
+        frozen_edge = extract_status_lines(lines, "frozen edge")
+        result["frozen_edge"] = int(frozen_edge[0]) if frozen_edge else None
+        result["status"] = status_lines_to_dict(lines)
+    except Exception as e:
+        result["ok"] = False
+        result["error"] = f"{e.__class__.__name__}: {e}"
+    result["time"] = round(time() - start, 3)
+    return result
+
+
+def status_summary(results: list, lag: int, elapsed: float) -> dict:
+    """Aggregate view of a status sweep: frozen edge spread, laggards and unreachable hosts"""
+    edges = [result["frozen_edge"] for result in results if result["ok"] and result["frozen_edge"] is not None]
+    summary = {"hosts": len(results), "reachable": sum(1 for result in results if result["ok"]),
+               "unreachable": [result["host"] for result in results if not result["ok"]],
+               "elapsed": round(elapsed, 3)}
+    if edges:
+        top = max(edges)
+        summary["frozen_edge"] = {"max": top, "min": min(edges), "spread": top - min(edges),
+                                  "median": sorted(edges)[len(edges) // 2]}
+        summary["laggards"] = [{"host": result["host"], "frozen_edge": result["frozen_edge"],
+                                "behind": top - result["frozen_edge"]}
+                               for result in results
+                               if result["ok"] and result["frozen_edge"] is not None
+                               and top - result["frozen_edge"] > lag]
+        summary["slowest"] = max((result for result in results if result["ok"]), key=lambda result: result["time"])["host"]
+    return summary
 
 
-def get_frozen(ctx):
-    """Helper to fetch frozen edge from a client"""
+@cli.command()
+@click.pass_context
+@click.argument('hosts', nargs=-1)
+@click.option('--file', '-f', 'file_name', type=click.File('r'), default=None,
+              help="Text file with one host or host:port a line, - for stdin")
+@click.option('--workers', '-w', default=32, type=int, help="Verifiers queried at the same time")
+@click.option('--host_timeout', default=5.0, type=float, help="Seconds allowed to each verifier")
+@click.option('--lag', default=5, type=int, help="Blocks behind the highest frozen edge to be reported as laggard")
+@click.option('--output', '-o', default=None, help="Also write the per host json lines to that file")
+def status(ctx, hosts, file_name, workers, host_timeout, lag, output):
+    """Get Status of distant server, or of many servers at once
+
+    With no HOSTS nor --file, asks the default verifier and prints its raw status.
+    Otherwise prints a json line per host, then a json summary line."""
+    from pynyzo.message import Message
+    from pynyzo.messageobject import EmptyMessageObject
+    from pynyzo.messagetype import MessageType
+    hosts = list(hosts)
+    if file_name:
+        hosts.extend(read_hosts(file_name))
+    if not hosts:
+        # ex : python3 Nyzocli.py  -j status 159.69.216.65
+        connect(ctx, ctx.obj['verifier_ip'])
+        if VERBOSE:
+            app_log.info(f"Connected to {ctx.obj['verifier_ip']}")
+        empty = EmptyMessageObject(app_log=app_log)
+        message = Message(MessageType.StatusRequest17, empty, app_log=app_log)
+        with timed(ctx, "status_fetch"):
+            res = verifier_request(ctx, message)
+        print(res.to_json())
+        # print(json.dumps(status))
+        return
+    config = load_keys()
+    if not VERBOSE:
+        # pynyzo warns about every unvalidated message, that would mess the json lines
+        config.VERBOSE = False
+    pool = get_verifier_pool(ctx)
+    start = time()
+    # Results come in hosts order, the sweep lasts about as long as the slowest verifier.
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(hosts)))) as executor, timed(ctx, "status_sweep"):
+        results = list(executor.map(lambda host: fetch_host_status(pool, host, host_timeout), hosts))
+    summary = status_summary(results, lag, time() - start)
+    lines = [json.dumps(result) for result in results]
+    if output:
+        with open(output, "w") as fp:
+            fp.write("\n".join(lines) + "\n")
+    print("\n".join(lines))
+    print(json.dumps({"summary": summary}))
+
+
+def get_frozen(ctx, max_age: float=None):
+    """Helper to fetch frozen edge from a client.
+    Answers from the on-disk cache when it is less than max_age seconds old (default: --frozen_max_age)"""
+    if max_age is None:
+        max_age = ctx.obj['frozen_max_age']
+    if ctx.obj['frozen_cache'] and max_age > 0:
+        with timed(ctx, "frozen_cache"):
+            data = read_frozen_cache(ctx.obj['client'], max_age)
+        if data:
+            if VERBOSE:
+                app_log.info(f"Frozen edge {data['height']} from cache")
+            return data
     # TODO: Use newest helper from pynyzo
-    url = "{}/frozenEdge".format(ctx.obj['client'])
     if VERBOSE:
-        app_log.info(f"Calling {url}")
-    res = get(url)
+        app_log.info(f"Calling /frozenEdge on {ctx.obj['clients']}")
+    with timed(ctx, "frozen_fetch"):
+        res = client_read(ctx, "/frozenEdge")
     if VERBOSE:
         app_log.info(res)
     if path.isdir("tmp"):
@@ -281,6 +906,10 @@ def get_frozen(ctx):
         with open("tmp/answer.txt", "w") as fp:
             fp.write(res.text)
     data = fake_table_frozen_to_dict(res.text)
+    if not data['height']:
+        app_log.warning(f"No height in the /frozenEdge answer of {ctx.obj['client']}, unexpected page layout?")
+    if ctx.obj['frozen_cache'] and data['height']:
+        write_frozen_cache(ctx.obj['client'], data)
     return data
 
 
@@ -288,7 +917,8 @@ def get_frozen(ctx):
 @click.pass_context
 def frozen(ctx):
     """Get frozen edge from client"""
-    frozen = get_frozen(ctx)
+    # Always ask the client, but keeps the cache fresh for the next sends.
+    frozen = get_frozen(ctx, max_age=0)
     if ctx.obj['json']:
         print(json.dumps(frozen))
     else:
@@ -296,8 +926,147 @@ def frozen(ctx):
             print(f"{key}: {frozen[key]}")
 
 
+@cli.command()
+@click.pass_context
+@click.option('--probe', default=0, help='First ask every client for the frozen edge that many times (default 0)')
+def clients(ctx, probe: int):
+    """Recent latencies of the clients, in the order hedged reads use them. Seconds, failures count as --timeout.
+    - ex: python3 Nyzocli.py -c https://client.nyzo.co,https://nyzo.today clients --probe 5
+    """
+    reader = get_client_reader(ctx)
+    for _ in range(probe):
+        reader.probe("/frozenEdge")
+    for line in reader.report():
+        if ctx.obj['json']:
+            print(json.dumps(line))
+        else:
+            tail = f"p50 {line['p50']:0.3f}  p95 {line['p95']:0.3f}  p99 {line['p99']:0.3f}" if line['samples'] else "no data"
+            print(f"{line['endpoint']}: {line['samples']} samples  {tail}  hedge after {line['hedge_delay']:0.3f}")
+
+
+BLOCK_TIME = 7.0  # seconds, Nyzo block duration
+
+
+def next_poll_delay(timestamp_ms, advanced: bool, misses: int, min_interval: float, max_interval: float) -> float:
+    """Seconds to wait before asking for the frozen edge again.
+    Right after the edge advanced, aims at the next block, from its verification timestamp when it is sane.
+    Otherwise backs off a little more at each miss."""
+    now = time()
+    if advanced:
+        try:
+            verified = int(timestamp_ms) / 1000
+        except (TypeError, ValueError):
+            verified = 0
+        # Clock skew or a stale answer: count from now
+        base = verified if now - 3 * BLOCK_TIME < verified <= now else now
+        delay = base + BLOCK_TIME - now
+    else:
+        delay = min_interval * misses
+    return min(max(delay, min_interval), max_interval)
+
+
+def watched_balances(ctx, addresses: list, height: int, use_verifier: bool, workers: int) -> dict:
+    """Current balances of the watched hex addresses, in micro nyzos, None when unknown"""
+    if use_verifier:
+        items = fetch_balance_list(ctx, height).get_items()
+        balances = {}
+        for address in addresses:
+            with timed(ctx, "balance_scan"):
+                item = find_balance_item(items, bytes.fromhex(address))
+            balances[address] = None if item is None else item.get_balance()
+        return balances
+
+    def client_balance(address: str):
+        try:
+            data = fetch_client_balance(ctx, address)
+            return int(round(float(data["balance"].replace("∩", "")) * 1000000))
+        except (IndexError, KeyError, ValueError):
+            # No balance in the client answer. Network errors go up.
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(addresses)))) as executor:
+        return dict(zip(addresses, executor.map(client_balance, addresses)))
+
+
+@cli.command("watch-balance")
+@click.pass_context
+@click.argument('addresses', nargs=-1, type=str)
+@click.option('--file', '-f', 'address_file', type=click.File('r'), default=None,
+              help='Also read addresses from that file, one a line. Use - for stdin')
+@click.option('--verifier', 'use_verifier', is_flag=True, default=False,
+              help='Watch the verifier balance list instead of the client, one request for all addresses')
+@click.option('--workers', '-w', default=8, help='Concurrent client balance requests (default 8)')
+@click.option('--min_interval', default=1.0, help='Min seconds between frozen edge polls (default 1)')
+@click.option('--max_interval', default=15.0, help='Max seconds between frozen edge polls (default 15)')
+@click.option('--blocks', 'max_blocks', default=0, help='Stop after that many new frozen blocks (default 0, never)')
+def watch_balance(ctx, addresses, address_file, use_verifier: bool, workers: int, min_interval: float,
+                  max_interval: float, max_blocks: int):
+    """Watch the balance of ADDRESSES, one JSON line event each time one changes.
+    Balances are only asked for again once the frozen edge advanced, polls follow the block pace.
+    The first line for each address has "event": "initial", the next ones "event": "change". Amounts are micro nyzos.
+    Errors are reported on stderr, as "event": "error" lines, and the watch goes on.
+    - ex: python3 Nyzocli.py watch-balance abd7fede35a84b10-8a36e6dc361d9b32-ca84d149f6eb85b4-a4e63015278d4c9f
+    - ex: python3 Nyzocli.py -i verifier0.nyzo.co watch-balance --verifier -f deposit_addresses.txt
+    """
+    config = load_keys()
+    if not VERBOSE:
+        # pynyzo warns about every unvalidated message, that would mess the json lines
+        config.VERBOSE = False
+    if address_file is not None:
+        addresses = chain(addresses, (line.strip() for line in address_file if line.strip()))
+    watched = {}  # hex address -> id__
+    for address in addresses:
+        id__address, address_hex = normalize_address(address, asHex=True)
+        watched[address_hex] = id__address
+    if not watched:
+        id__address, address_hex = normalize_address(wallet_address(), asHex=True)
+        watched[address_hex] = id__address
+    addresses = list(watched)
+    balances = {}
+    last_height = 0
+    seen = 0
+    misses = 0
+    while True:
+        try:
+            timestamp = None
+            if use_verifier:
+                height = fetch_frozen_height(ctx)
+            else:
+                frozen = get_frozen(ctx, max_age=0)
+                height, timestamp = int(frozen['height']), frozen.get('timestamp')
+            advanced = height > last_height
+            if advanced:
+                misses = 0
+                for address, current in watched_balances(ctx, addresses, height, use_verifier, workers).items():
+                    previous = balances.get(address, None)
+                    if address in balances and current == previous:
+                        continue
+                    event = {"event": "change" if address in balances else "initial", "block": height,
+                             "address": address, "id__": watched[address], "balance": current}
+                    if address in balances:
+                        event["previous"] = previous
+                        event["delta"] = (current or 0) - (previous or 0)
+                    balances[address] = current
+                    print(json.dumps(event), flush=True)
+                last_height = height
+                seen += 1
+                if max_blocks and seen >= max_blocks:
+                    return
+            else:
+                misses += 1
+            delay = next_poll_delay(timestamp, advanced, misses, min_interval, max_interval)
+        except Exception as e:
+            # Never on stdout, that only carries balance events
+            print(json.dumps({"event": "error", "block": last_height, "error": str(e), "retry_in": max_interval}),
+                  file=sys.stderr, flush=True)
+            delay = max_interval
+        sleep(delay)
+
+
 def normalize_address(address: str, asHex: bool=False) -> Union[Tuple[str, str], Tuple[str, bytes]]:
     """Takes an address as raw byte or id__ and provides both formats back"""
+    from nyzostrings.nyzostringencoder import NyzoStringEncoder
+    from nyzostrings.nyzostringpublicidentifier import NyzoStringPublicIdentifier
     try:
         # convert recipient to raw if provided as id__
         if address.startswith("id__"):
@@ -323,14 +1092,61 @@ def normalize_address(address: str, asHex: bool=False) -> Union[Tuple[str, str],
         return address, bytes.fromhex(address_raw)
 
 
+def sign_transaction(key, address: str, recipient_raw: str, amount: int, data: str, frozen: dict,
+                     timestamp: int) -> str:
+    """Assembles and signs a standard transaction of amount micro nyzos with the given key,
+    returns it as a tx__ nyzostring"""
+    from modules.signing import encode_standard, standard_transaction
+    transaction = standard_transaction(address, recipient_raw, amount, data, frozen, timestamp)
+    if VERBOSE:
+        print(transaction.to_json())
+    sign = key.sign(transaction.get_bytes(for_signing=True))
+    return encode_standard(address, recipient_raw, amount, data, frozen, timestamp, sign)
+
+
+def forward_transaction(ctx, tx__: str) -> list:
+    """Forwards a signed tx__ nyzostring through the client, returns the decoded answer"""
+    url = "{}/forwardTransaction?transaction={}&action=run".format(ctx.obj['client'], tx__)
+    if VERBOSE:
+        app_log.info(f"Calling {url}")
+    with timed(ctx, "forward"):
+        res = get_http(ctx).get(url)
+    if VERBOSE:
+        app_log.info(res)
+    if path.isdir("tmp"):
+        # Store for debug purposes
+        with open("tmp/answer.txt", "w") as fp:
+            fp.write(res.text)
+    answer = fake_table_to_list(res.text)
+    notices = fake_table_notices(res.text)
+    if notices:
+        # As pynyzo does, every row carries the notices of the page
+        for row in answer:
+            row["notice"] = " ".join(notices)
+    return answer
+
+
+def send_transaction(ctx, key, address: str, recipient_raw: str, amount: int, data: str) -> dict:
+    """Signs a standard tx of amount micro nyzos with an already derived key, and forwards it.
+    Same answer as pynyzo NyzoClient.send: the first row of the client answer, with the tx__."""
+    frozen = get_frozen(ctx)
+    timestamp = int(time()*10)*100 + 10000  # Fixed 10 sec delay for inclusion
+    with timed(ctx, "sign"):
+        tx__ = sign_transaction(key, address, recipient_raw, amount, data, frozen, timestamp)
+    answer = forward_transaction(ctx, tx__)
+    result = answer[0] if answer else {"error": "Empty answer from client"}
+    result["tx__"] = tx__
+    return result
+
+
 @cli.command()
 @click.pass_context
 @click.argument('recipient', type=str)
-@click.argument('amount', default=0, type=float)
+@click.argument('amount', default="0", type=str)
 @click.argument('above', default=0, type=float)
 @click.argument('data', default='', type=str)
 @click.argument('key_', default="", type=str)    # key_ to vote with
-def send(ctx, recipient, amount: float=0, above: float=0, data: str="", key_: str=""):
+def send(ctx, recipient, amount: str="0", above: float=0, data: str="", key_: str=""):
     """
     Send Nyzo to a RECIPIENT.
     ABOVE is optional, if > 0 then the tx will only be sent when balance > ABOVE
@@ -339,13 +1155,19 @@ def send(ctx, recipient, amount: float=0, above: float=0, data: str="", key_: st
     - ex: python3 Nyzocli.py send abd7fede35a84b10-8a36e6dc361d9b32-ca84d149f6eb85b4-a4e63015278d4c9f 10
     - ex: python3 Nyzocli.py send abd7fede35a84b10-8a36e6dc361d9b32-ca84d149f6eb85b4-a4e63015278d4c9f 10 0 key_...
     """
+    from modules.signing import get_keys
+    full_balance = amount.strip() == "-1"
+    if not full_balance:
+        try:
+            # Exact micro nyzos, as signed
+            amount = micronyzos(amount)
+        except ValueError as e:
+            print(json.dumps({"result": "Error", "reason": str(e)}))
+            return
     # TODO: Use newest helper from pynyzo
-    if key_ == "":
-        seed = config.PRIVATE_KEY.to_bytes()
-    else:
-        seed = NyzoStringEncoder.decode(key_).get_bytes()
-    # convert key to address
-    address = KeyUtil.private_to_public(seed.hex())
+    seed = seed_from_key(key_)
+    # key and matching address, derived once
+    key, address = get_keys(seed)
 
     my_balance = None
     if above > 0:
@@ -356,12 +1178,12 @@ def send(ctx, recipient, amount: float=0, above: float=0, data: str="", key_: st
             print(json.dumps({"result": "Error", "reason": "Balance too low, {} instead of required {}"
                              .format(my_balance, above)}))
             return
-    if amount == -1:
+    if full_balance:
         if my_balance is None:
             my_balance = ctx.invoke(balance, address=address)
             print(my_balance)
             # my_balance = balance(ctx, address)
-        amount = float(my_balance)
+        amount = micronyzos(my_balance)
         if amount <= 0:
             if VERBOSE:
                 app_log.warning("Balance too low or unknown {}, dropping.".format(my_balance))
@@ -375,61 +1197,14 @@ def send(ctx, recipient, amount: float=0, above: float=0, data: str="", key_: st
     recipient, recipient_raw = normalize_address(recipient, asHex=True)
     frozen = get_frozen(ctx)
     if VERBOSE:
-        app_log.info(f"Sending {amount} to {recipient} since balance of {address} is > {above}.")
+        app_log.info(f"Sending {amount / 1000000} to {recipient} since balance of {address} is > {above}.")
         app_log.info(f"Frozen edge is at {frozen['height']}")
 
-    # Create a tx
+    # Create, sign and send the tx
     timestamp = int(time()*10)*100 + 10000  # Fixed 10 sec delay for inclusion
-    # print(timestamp, hex(timestamp))
-    data_bytes = data[:32].encode("utf-8")
-    transaction = Transaction(buffer=None, type=Transaction.type_standard, timestamp=timestamp,
-                              sender_identifier=bytes.fromhex(address), amount=int(amount*1e6),
-                              receiver_identifier=bytes.fromhex(recipient_raw),
-                              previous_block_hash=bytes.fromhex(frozen["hash"]),
-                              previous_hash_height=frozen['height'],
-                              signature=b'', sender_data=data_bytes)
-    # transaction = Transaction.from_vote_data(timestamp, bytes.fromhex(address), vote, cycle_tx_sig_bytes)
-    if VERBOSE:
-        print(transaction.to_json())
-
-    key, _ = KeyUtil.get_from_private_seed(seed.hex())
-    # print("key", key.to_bytes().hex())
-    to_sign = transaction.get_bytes(for_signing=True)
-    # print("To Sign", to_sign.hex())
-    sign = KeyUtil.sign_bytes(to_sign, key)
-    # print("Sign", sign.hex())
-    """"    
-        tx_type: int,
-        timestamp: int,
-        amount: int,
-        receiver_identifier: bytes,
-        
-        previous_hash_height: int,
-        previous_block_hash: bytes,
-        sender_identifier: bytes,
-        sender_data: bytes,
-        signature: bytes,
-        vote: int = 0,
-        transaction_signature: bytes = b''
-    """
-    tx = NyzoStringTransaction(Transaction.type_standard, timestamp, int(amount*1e6), bytes.fromhex(recipient_raw),
-                               frozen['height'],
-                               bytes.fromhex(frozen["hash"]),
-                               bytes.fromhex(address), data_bytes,
-                               sign)
-    tx__ = NyzoStringEncoder.encode(tx)
-    # Send the tx
-    url = "{}/forwardTransaction?transaction={}&action=run".format(ctx.obj['client'], tx__)
-    if VERBOSE:
-        app_log.info(f"Calling {url}")
-    res = get(url)
-    if VERBOSE:
-        app_log.info(res)
-    if path.isdir("tmp"):
-        # Store for debug purposes
-        with open("tmp/answer.txt", "w") as fp:
-            fp.write(res.text)
-    temp = fake_table_to_list(res.text)
+    with timed(ctx, "sign"):
+        tx__ = sign_transaction(key, address, recipient_raw, amount, data, frozen, timestamp)
+    temp = forward_transaction(ctx, tx__)
     if ctx.obj['json']:
         print(json.dumps(temp))
     else:
@@ -439,6 +1214,308 @@ def send(ctx, recipient, amount: float=0, above: float=0, data: str="", key_: st
             print("Ok")
 
 
+def forward_row(ctx, row: dict) -> dict:
+    """Forwards the signed tx__ of a batch row, and completes the row with the outcome"""
+    try:
+        answer = forward_transaction(ctx, row["tx__"])
+        if len(answer) == 0:
+            row["result"], row["error"] = "Error", "Empty answer from client"
+        elif "error" in answer[-1]:
+            row["result"], row["error"] = "Error", answer[-1]["error"]
+        else:
+            row["result"] = "Ok"
+            row["block"] = answer[0].get("block height")
+            row["forwarded"] = answer[0].get("forwarded")
+        if answer and answer[0].get("notice"):
+            row["notice"] = answer[0]["notice"]
+    except Exception as e:
+        row["result"], row["error"] = "Error", str(e)
+    return row
+
+
+@cli.command("send-batch")
+@click.pass_context
+@click.argument('file', type=click.File('r'))
+@click.argument('key_', default="", type=str)
+@click.option('--workers', '-w', default=8, help='Max concurrent forwards (default 8)')
+@click.option('--max_age', '-m', default=30, help='Refresh the frozen edge once older than this, in seconds (default 30)')
+@click.option('--output', '-o', type=click.File('a'), default='-', help='JSONL result log (default stdout)')
+def send_batch(ctx, file, key_: str="", workers: int=8, max_age: int=30, output=None):
+    """
+    Send Nyzo to every recipient of a payout FILE, with one JSON result line per row.
+    FILE has one payout a line, either CSV "recipient,amount[,data]" or JSON {"recipient":..., "amount":..., "data":...}
+    Use - as FILE to read from stdin. If no seed is given, use the wallet one.
+    - ex: python3 Nyzocli.py send-batch payouts.csv
+    - ex: python3 Nyzocli.py send-batch -w 16 -o results.jsonl payouts.jsonl key_...
+    """
+    from modules.signing import SigningEngine, encode_standard, get_keys, standard_transaction
+    seed = seed_from_key(key_)
+    _, address = get_keys(seed)
+    frozen = get_frozen(ctx)
+    frozen_at = time()
+    if not frozen.get('height'):
+        print(json.dumps({"result": "Error", "reason": "Unable to get frozen edge"}))
+        return
+    counts = {"Ok": 0, "Error": 0}
+
+    def build(row: dict, timestamp: int) -> bytes:
+        nonlocal frozen, frozen_at
+        if row["micronyzos"] <= 0:
+            raise ValueError("Amount has to be > 0")
+        row["recipient"], row["recipient_raw"] = normalize_address(row["recipient"], asHex=True)
+        if time() - frozen_at > max_age:
+            frozen = get_frozen(ctx, max_age=max_age)
+            frozen_at = time()
+        # The edge may be refreshed before the signature is back
+        row["frozen"] = frozen
+        return standard_transaction(address, row["recipient_raw"], row["micronyzos"], row["data"], frozen,
+                                    timestamp).get_bytes(for_signing=True)
+
+    def encode(row: dict, signature: bytes) -> str:
+        return encode_standard(address, row.pop("recipient_raw"), row["micronyzos"], row["data"], row.pop("frozen"),
+                               row["timestamp"], signature)
+
+    # Rows are signed by the engine processes, forwarded by the pool and written back in order.
+    # At most 2 * workers rows are in flight, plus the ones being signed, whatever the file size.
+    pending = deque()
+    with SigningEngine([seed], chunk_size=BATCH_SIGN_CHUNK) as engine, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        # Signing processes are forked before the first forward starts a thread
+        engine.start()
+        for row in signed_rows(engine, read_payout_rows(file), build, encode, live=True,
+                               timer=obj_timer(ctx.obj)):
+            if "error" in row:
+                row.pop("recipient_raw", None)
+                row.pop("frozen", None)
+                row["result"] = "Error"
+                pending.append(row)
+            else:
+                pending.append(executor.submit(forward_row, ctx, row))
+            while len(pending) >= 2 * workers:
+                write_batch_result(pending.popleft(), output, counts)
+        while pending:
+            write_batch_result(pending.popleft(), output, counts)
+    if VERBOSE:
+        app_log.info(f"Batch done from {address}: {counts['Ok']} Ok, {counts['Error']} Error.")
+
+
+def write_batch_result(item, output, counts: dict) -> None:
+    """Writes a finished batch row - or the one of a pending forward - as a JSON line"""
+    row = item.result() if isinstance(item, Future) else item
+    counts[row["result"]] += 1
+    output.write(json.dumps(row) + "\n")
+    output.flush()
+
+
+# Rows per signing chunk for the batches that forward as they sign: with a few chunks per process ahead,
+# tx are signed shortly before their forward, and their timestamps stay ahead of the chain.
+BATCH_SIGN_CHUNK = 16
+
+
+def signed_rows(engine, rows: Iterator[dict], build: Callable, encode: Callable, start_timestamp: int=0,
+                live: bool=False, timer: Callable=None) -> Iterator[dict]:
+    """Signs rows through the SigningEngine, yields them in order with their tx__ - or their error.
+    build(row, timestamp) gives the bytes to sign, None if there is nothing to sign, or raises if the row is not valid.
+    encode(row, signature) gives the tx__.
+    Timestamps follow each other from start_timestamp. live, they also follow the clock, 10 sec ahead as send does.
+    timer (see obj_timer) gets the time spent waiting on the engine as the "sign" phase, the tx assembly included.
+    Only the rows the engine is working on are held, whatever the input size."""
+    rows = iter(rows)
+    in_flight = deque()
+    ready = []  # a row not to sign with nothing ahead of it
+    last_timestamp = start_timestamp - 1
+
+    def payloads():
+        nonlocal last_timestamp
+        for row in rows:
+            payload = None
+            if "error" not in row:
+                # Distinct timestamps, so no two tx of the file are alike
+                timestamp = max(int(time()*10)*100 + 10000, last_timestamp + 1) if live else last_timestamp + 1
+                try:
+                    payload = build(row, timestamp)
+                except Exception as e:
+                    row["error"] = str(e)
+            if payload is not None:
+                last_timestamp = timestamp
+                row["timestamp"] = timestamp
+                in_flight.append(row)
+                yield 0, payload
+                continue
+            if not in_flight:
+                # Nothing ahead: out right away, the engine is done
+                ready.append(row)
+                return
+            # Goes through the engine unsigned, so it comes out in the file order
+            in_flight.append(row)
+            yield 0, None
+
+    while True:
+        stream = engine.sign_stream(payloads())
+        while True:
+            with timer("sign") if timer else nullcontext():
+                result = next(stream, None)
+            if result is None:
+                break
+            signature, error = result
+            row = in_flight.popleft()
+            if error:
+                row["error"] = error
+            elif signature is not None:
+                row["tx__"] = encode(row, signature)
+            yield row
+        if not ready:
+            return
+        yield ready.pop()
+
+
+@cli.command()
+@click.pass_context
+@click.argument('file', type=click.File('r'))
+@click.argument('key_', default="", type=str)
+@click.option('--frozen', 'frozen_file', type=click.File('r'), default=None,
+              help='JSON frozen edge, as saved by "--json frozen" on an online box')
+@click.option('--height', default=0, help='Frozen block height the tx refer to, if no --frozen')
+@click.option('--hash', 'block_hash', default='', help='Hash of that frozen block, if no --frozen')
+@click.option('--votes', is_flag=True, default=False,
+              help='FILE is a vote file, one "sig_... [vote]" a line. Votes need no frozen block')
+@click.option('--timestamp', default=0, help='Timestamp of the first tx in ms, the next ones follow (default now + 10 sec)')
+@click.option('--workers', '-w', default=0, help='Signing processes (default 0, one per cpu)')
+@click.option('--output', '-o', type=click.File('w'), default='-', help='tx__ file, one a line (default stdout)')
+def sign(ctx, file, key_: str, frozen_file, height: int, block_hash: str, votes: bool, timestamp: int, workers: int,
+         output):
+    """Sign a payout FILE offline, into a file of tx__ strings for broadcast. Does not touch the network.
+    FILE has the send-batch format, the frozen block the tx refer to is given, as --frozen or --height and --hash.
+    With --votes, FILE has one cycle tx vote a line instead, "sig_... [vote]" as for massvote, 1 by default.
+    Malformed rows are reported as JSON lines on stderr, with their line number, and left out.
+    If no seed is given, use the wallet one.
+    - ex: python3 Nyzocli.py sign --frozen frozen.json -o payouts.tx payouts.csv key_...
+    - ex: python3 Nyzocli.py sign --height 10228622 --hash 018f...d4d2 --timestamp 1608397200000 payouts.csv
+    - ex: python3 Nyzocli.py sign --votes -o votes.tx sigs.txt key_...
+    """
+    from modules.signing import SigningEngine, encode_standard, encode_vote, get_keys, standard_transaction, \
+        vote_payload, vote_transaction
+    seed = seed_from_key(key_)
+    _, address = get_keys(seed)
+    frozen = None
+    if votes:
+        rows = read_vote_rows(file)
+
+        def build(row: dict, tx_timestamp: int) -> bytes:
+            return vote_payload(vote_transaction(address, row["sig"], row["vote"], tx_timestamp))
+
+        def encode(row: dict, signature: bytes) -> str:
+            return encode_vote(address, row["sig"], row["vote"], row["timestamp"], signature)
+    else:
+        if frozen_file is not None:
+            frozen = json.load(frozen_file)
+            height, block_hash = int(frozen["height"]), frozen["hash"]
+        if height <= 0 or not re.fullmatch(r"[0-9a-fA-F]{64}", block_hash):
+            raise click.UsageError("A frozen block is needed: --frozen, or --height and a 64 hex chars --hash")
+        frozen = {"height": height, "hash": block_hash}
+        rows = read_payout_rows(file)
+
+        def build(row: dict, tx_timestamp: int) -> bytes:
+            if row["micronyzos"] <= 0:
+                raise ValueError("Amount has to be > 0")
+            row["recipient"], row["recipient_raw"] = normalize_address(row["recipient"], asHex=True)
+            return standard_transaction(address, row["recipient_raw"], row["micronyzos"], row["data"], frozen,
+                                        tx_timestamp).get_bytes(for_signing=True)
+
+        def encode(row: dict, signature: bytes) -> str:
+            return encode_standard(address, row.pop("recipient_raw"), row["micronyzos"], row["data"], frozen,
+                                   row["timestamp"], signature)
+    if not timestamp:
+        timestamp = int(time()*10)*100 + 10000  # Same 10 sec delay for inclusion as send
+    counts = {"signed": 0, "errors": 0}
+    with SigningEngine([seed], workers=workers or None, min_parallel=1) as engine:
+        with timed(ctx, "sign"):
+            for row in signed_rows(engine, rows, build, encode, timestamp):
+                if "error" in row:
+                    counts["errors"] += 1
+                    print(json.dumps({"line": row["line"], "error": row["error"]}), file=sys.stderr)
+                    continue
+                counts["signed"] += 1
+                output.write(row["tx__"] + "\n")
+    output.flush()
+    summary = {"address": address, **counts, "first_timestamp": timestamp}
+    if frozen:
+        summary["frozen"] = frozen
+    print(json.dumps({"summary": summary}), file=sys.stderr)
+
+
+BLOCK_DURATION = 7000  # ms
+
+
+def tx_expired(timestamp: int, frozen: dict) -> bool:
+    """True if a tx timestamp falls in an already frozen block, so the tx can not be included anymore.
+    Blocks are verified within a block duration after their end: a timestamp older than the frozen edge
+    verification timestamp by more than that is in a frozen block."""
+    return timestamp < int(frozen.get("timestamp") or 0) - BLOCK_DURATION
+
+
+@cli.command()
+@click.pass_context
+@click.argument('file', type=click.File('r'))
+@click.option('--workers', '-w', default=8, help='Max concurrent forwards (default 8)')
+@click.option('--max_age', '-m', default=30, help='Refresh the frozen edge once older than this, in seconds (default 30)')
+@click.option('--output', '-o', default='-', help='JSONL result log (default stdout)')
+def broadcast(ctx, file, workers: int, max_age: int, output: str):
+    """Forward the signed tx of FILE through the client, with one JSON result line per tx, in the file order.
+    FILE has one tx__ a line, as written by sign, or JSON lines with a "tx__" key. Use - to read from stdin.
+    A tx whose timestamp is already behind the frozen edge is not forwarded, but logged as "Expired".
+    With an --output file, a new run skips the lines already logged there.
+    - ex: python3 Nyzocli.py broadcast -w 16 -o results.jsonl payouts.tx
+    """
+    from modules.signing import transaction_timestamp
+    done = 0
+    if output != '-':
+        last = read_last_jsonl(output)
+        done = last["line"] if last else 0
+        if done and VERBOSE:
+            app_log.info(f"Resuming after line {done}")
+    frozen = get_frozen(ctx)
+    frozen_at = time()
+    if not frozen.get('height'):
+        print(json.dumps({"result": "Error", "reason": "Unable to get frozen edge"}))
+        return
+    counts = {"Ok": 0, "Error": 0, "Expired": 0}
+    # Same pipeline as send-batch: at most 2 * workers rows in flight, whatever the file size.
+    pending = deque()
+    with click.open_file(output, 'a') as log, ThreadPoolExecutor(max_workers=workers) as executor:
+        for row in read_tx_rows(file):
+            if row["line"] <= done:
+                continue
+            if time() - frozen_at > max_age:
+                fresh = get_frozen(ctx, max_age=max_age)
+                frozen_at = time()
+                # Keep the previous edge if the client had none
+                if fresh.get('height'):
+                    frozen = fresh
+            if "error" not in row:
+                try:
+                    # nyzostrings prints decode errors
+                    with redirect_stdout(sys.stderr):
+                        row["timestamp"] = transaction_timestamp(row["tx__"])
+                except Exception as e:
+                    row["error"] = f"Malformed tx__: {e}"
+                else:
+                    if tx_expired(row["timestamp"], frozen):
+                        row["result"], row["frozen_height"] = "Expired", frozen["height"]
+            if "error" in row:
+                row["result"] = "Error"
+            if "result" in row:
+                pending.append(row)
+            else:
+                pending.append(executor.submit(forward_row, ctx, row))
+            while len(pending) >= 2 * workers:
+                write_batch_result(pending.popleft(), log, counts)
+        while pending:
+            write_batch_result(pending.popleft(), log, counts)
+    if VERBOSE:
+        app_log.info(f"Broadcast done: {counts['Ok']} Ok, {counts['Error']} Error, {counts['Expired']} Expired.")
+
+
 @cli.command()
 @click.pass_context
 @click.argument('recipient', type=str)
@@ -452,13 +1529,14 @@ def safe_send(ctx, recipient, amount: float = 0, data: str = "", key_: str = "")
     - ex: python3 Nyzocli.py safe_send abd7fede35a84b10-8a36e6dc361d9b32-ca84d149f6eb85b4-a4e63015278d4c9f 10
     - ex: python3 Nyzocli.py safe_send abd7fede35a84b10-8a36e6dc361d9b32-ca84d149f6eb85b4-a4e63015278d4c9f 10 key_...
     """
+    from nyzostrings.nyzostringencoder import NyzoStringEncoder
+    from nyzostrings.nyzostringprivateseed import NyzoStringPrivateSeed
+    from modules.signing import get_keys
+    seed = seed_from_key(key_)
     if key_ == "":
-        seed = config.PRIVATE_KEY.to_bytes()
         key_ = NyzoStringEncoder.encode(NyzoStringPrivateSeed.from_hex(seed.hex()))
-    else:
-        seed = NyzoStringEncoder.decode(key_).get_bytes()
     # convert key to address
-    address = KeyUtil.private_to_public(seed.hex())
+    _, address = get_keys(seed)
 
     my_balance = ctx.invoke(balance, address=address)
     if amount == -1:
@@ -479,12 +1557,191 @@ def safe_send(ctx, recipient, amount: float = 0, data: str = "", key_: str = "")
 
     recipient, recipient_raw = normalize_address(recipient, asHex=True)
 
-    client = NyzoClient(ctx.obj['client'])
+    client = get_nyzo_client(ctx)
     res = client.safe_send(recipient, amount, data, key_, max_tries=5, verbose=True)
     print(res)
     return
 
 
+def search_transaction(ctx, tx__: str) -> int:
+    """Height a tx__ was frozen at, according to the client. 0 if not found."""
+    url = "{}/transactionSearch?string={}&action=run".format(ctx.obj['client'], tx__)
+    with timed(ctx, "transaction_search"):
+        res = get_http(ctx).get(url)
+    try:
+        return int(fake_table_to_list(res.text)[0].get("height", 0))
+    except (IndexError, ValueError):
+        return 0
+
+
+def block_signatures(ctx, heights: set) -> dict:
+    """Signatures of the transactions of the given blocks, from the verifier. {height: set of signatures}"""
+    signatures = {}
+    for height in sorted(heights):
+        if height in signatures:
+            continue
+        connect(ctx, ctx.obj['verifier_ip'])
+        blocks, _ = fetch_blocks(ctx, height, max(heights))
+        if not blocks:
+            raise RuntimeError(f"Verifier has no block {height}")
+        for block in blocks:
+            # pynyzo Block has no getters for these
+            signatures[block._height] = {bytes(transaction.get_signature()) for transaction in block._transactions}
+    return signatures
+
+
+@cli.command("safe-send-batch")
+@click.pass_context
+@click.argument('file', type=click.File('r'))
+@click.argument('key_', default="", type=str)
+@click.option('--workers', '-w', default=8, help='Max concurrent forwards and searches (default 8)')
+@click.option('--max_tries', default=5, help='Tries per payout before giving up (default 5)')
+@click.option('--margin', default=1, help='Blocks to wait past the planned block before checking (default 1)')
+@click.option('--verifier', 'use_verifier', is_flag=True, default=False,
+              help='Check inclusion from the verifier blocks, instead of one client search per tx')
+@click.option('--window', default=1000, type=click.IntRange(min=1),
+              help='Max payouts forwarded and not settled yet (default 1000)')
+@click.option('--output', '-o', type=click.File('a'), default='-', help='JSONL result log (default stdout)')
+def safe_send_batch(ctx, file, key_: str="", workers: int=8, max_tries: int=5, margin: int=1,
+                    use_verifier: bool=False, window: int=1000, output=None):
+    """
+    Send Nyzo to every recipient of a payout FILE, and make sure every tx is embedded in its planned block.
+    FILE is the same as for send-batch. Rows are read and forwarded as they go, up to --window of them waiting
+    for their block, then checked together as the frozen edge reaches their blocks. Only the ones that missed are
+    signed again and forwarded, up to --max_tries times, or none more if the client said they may not be approved.
+    One JSON result line per row once it is settled, "result" being "Ok" (in "height") or "Error".
+    Client notices about a tx are kept in its "notice".
+    - ex: python3 Nyzocli.py safe-send-batch payouts.csv
+    - ex: python3 Nyzocli.py -i 1.2.3.4 safe-send-batch --verifier -o results.jsonl payouts.csv key_...
+    """
+    from modules.signing import SigningEngine, encode_standard, get_keys, standard_transaction, transaction_signature
+    config = load_keys()
+    if not VERBOSE:
+        # pynyzo warns about every unvalidated message, that would mess the json lines
+        config.VERBOSE = False
+    seed = seed_from_key(key_)
+    _, address = get_keys(seed)
+    start = time()
+    counts = {"Ok": 0, "Error": 0}
+    # tx signature (hex) -> row, for the forwarded rows waiting for their block. At most window of them.
+    pending = {}
+    last_timestamp = 0
+    rows = read_payout_rows(file)
+    exhausted = False
+
+    def settle(row: dict, result: str, **values) -> None:
+        row.update(values)
+        row["result"] = result
+        counts[result] += 1
+        output.write(json.dumps(row) + "\n")
+        output.flush()
+
+    def submit(batch: list) -> None:
+        """Signs the rows with a fresh timestamp, forwards them all, and adds the forwarded ones to pending"""
+        nonlocal last_timestamp
+        if not batch:
+            return
+        frozen = get_frozen(ctx)
+        for row in batch:
+            for field in ("tx__", "block", "forwarded", "notice", "error", "result"):
+                row.pop(field, None)
+            row["tries"] = row.get("tries", 0) + 1
+
+        def build(row: dict, timestamp: int) -> bytes:
+            return standard_transaction(address, row["recipient_raw"], row["micronyzos"], row["data"], frozen,
+                                        timestamp).get_bytes(for_signing=True)
+
+        def encode(row: dict, signature: bytes) -> str:
+            return encode_standard(address, row.pop("recipient_raw"), row["micronyzos"], row["data"], frozen,
+                                   row["timestamp"], signature)
+
+        signed = []
+        for row in signed_rows(engine, batch, build, encode, last_timestamp + 1, live=True,
+                               timer=obj_timer(ctx.obj)):
+            if "error" in row:
+                row.pop("recipient_raw", None)
+                settle(row, "Error")
+            else:
+                last_timestamp = row["timestamp"]
+                signed.append(row)
+        for row in executor.map(lambda row: forward_row(ctx, row), signed):
+            if row["result"] == "Ok" and str(row.get("forwarded", "")).lower() != "false" and row.get("block"):
+                row.pop("result")
+                pending[transaction_signature(row["tx__"]).hex()] = row
+            else:
+                settle(row, "Error", error=row.get("error", "Not forwarded"))
+
+    def refill() -> None:
+        """Reads and forwards new rows of the file, until window rows are pending or the file is done"""
+        nonlocal exhausted
+        while not exhausted and len(pending) < window:
+            batch = []
+            while len(pending) + len(batch) < window:
+                row = next(rows, None)
+                if row is None:
+                    exhausted = True
+                    break
+                if "error" not in row:
+                    try:
+                        if row["micronyzos"] <= 0:
+                            raise ValueError("Amount has to be > 0")
+                        row["recipient"], row["recipient_raw"] = normalize_address(row["recipient"], asHex=True)
+                        batch.append(row)
+                        continue
+                    except Exception as e:
+                        row["error"] = str(e)
+                settle(row, "Error")
+            submit(batch)
+
+    with SigningEngine([seed], chunk_size=BATCH_SIGN_CHUNK) as engine, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        # Signing processes are forked before the first forward starts a thread
+        engine.start()
+        refill()
+        misses = 0
+        while pending:
+            frozen = get_frozen(ctx, max_age=0)
+            height = int(frozen.get("height", 0) or 0)
+            due = {signature: row for signature, row in pending.items() if int(row["block"]) + margin <= height}
+            if due:
+                misses = 0
+                # All the tx whose block is frozen are checked together
+                if use_verifier:
+                    with timed(ctx, "inclusion_check"):
+                        signatures = block_signatures(ctx, {int(row["block"]) for row in due.values()})
+                    included = {signature: int(row["block"]) if bytes.fromhex(signature) in signatures.get(
+                                int(row["block"]), ()) else 0 for signature, row in due.items()}
+                else:
+                    heights = executor.map(lambda row: search_transaction(ctx, row["tx__"]), due.values())
+                    included = dict(zip(due, heights))
+                missed = []
+                for signature, row in due.items():
+                    del pending[signature]
+                    if included[signature] and included[signature] == int(row["block"]):
+                        settle(row, "Ok", height=included[signature])
+                    elif "may not be approved" in row.get("notice", ""):
+                        # Same as pynyzo safe_send: no use sending it again
+                        settle(row, "Error", error="Forwarded but not in chain, the client said it may not be approved")
+                    elif row["tries"] >= max_tries:
+                        settle(row, "Error", error=f"Forwarded but still not in chain after {max_tries} tries")
+                    else:
+                        row["recipient_raw"] = normalize_address(row["recipient"], asHex=True)[1]
+                        missed.append(row)
+                if VERBOSE:
+                    app_log.info(f"Frozen edge {height}: {len(due) - len(missed)} settled, {len(missed)} to send again, "
+                                 f"{len(pending)} pending.")
+                submit(missed)
+                # Settled rows made room for new ones
+                refill()
+            else:
+                misses += 1
+            if pending:
+                sleep(next_poll_delay(frozen.get("timestamp"), bool(due), misses, 1.0, 15.0))
+    if VERBOSE:
+        app_log.info(f"Safe batch done from {address} in {time() - start:0.1f} sec: "
+                     f"{counts['Ok']} Ok, {counts['Error']} Error.")
+
+
 @cli.command()
 @click.pass_context
 @click.argument('cycle_tx_sig', type=str)  # Cycle tx to vote for
@@ -498,60 +1755,113 @@ def vote(ctx, cycle_tx_sig: str, vote: int=1, key_: str=""):
     - ex: python3 Nyzocli.py vote sig_gc6VHCY_yfjRc_DyosRLdi084AbY5wP9yVdTTRhajp4JUk7nbRw9c-aufwEwGY~.x0m55u.v.tGzjnA7VYP4V0m-eXyG 1
     - ex: python3 Nyzocli.py vote sig_gc6VHCY_yfjRc_DyosRLdi084AbY5wP9yVdTTRhajp4JUk7nbRw9c-aufwEwGY~.x0m55u.v.tGzjnA7VYP4V0m-eXyG 0 key_...
     """
-    if key_ == "":
-        seed = config.PRIVATE_KEY.to_bytes()
-    else:
-        seed = NyzoStringEncoder.decode(key_).get_bytes()
-    key, _ = KeyUtil.get_from_private_seed(seed.hex())
-    # reconvert key to address
-    address = KeyUtil.private_to_public(seed.hex())
+    from modules.signing import get_keys, sign_vote, vote_timestamp
+    seed = seed_from_key(key_)
+    # key and matching address
+    key, address = get_keys(seed)
     if VERBOSE:
         app_log.info(f"Voting {vote} for {cycle_tx_sig} with id {address}")
-    cycle_tx_sig_bytes = NyzoStringEncoder.decode(cycle_tx_sig).get_bytes()
     # Create a tx
-    timestamp = int(time()*10)*100 + 10000  # Fixed 10 sec delay for inclusion
-    # print(timestamp, hex(timestamp))
-    cycle_transaction_signature_hex = cycle_tx_sig_bytes.hex()
-    transaction = Transaction.from_vote_data(timestamp, bytes.fromhex(address), vote, cycle_tx_sig_bytes)
+    timestamp = vote_timestamp(time())
+    with timed(ctx, "sign"):
+        transaction, tx__ = sign_vote(key, address, cycle_tx_sig, vote, timestamp)
     print(transaction.to_json())
-    sign = KeyUtil.sign_bytes(transaction.get_bytes(for_signing=True)[:106], key)
-    tx = NyzoStringTransaction.from_hex_vote(hex(timestamp), address, sign.hex(), vote, cycle_transaction_signature_hex)
-    tx__ = NyzoStringEncoder.encode(tx)
     # Send the tx
-    url = "{}/forwardTransaction?transaction={}&action=run".format(ctx.obj['client'], tx__)
-    if VERBOSE:
-        app_log.info(f"Calling {url}")
-    res = get(url)
-    if VERBOSE:
-        app_log.info(res)
-    if path.isdir("tmp"):
-        # Store for debug purposes
-        with open("tmp/answer.txt", "w") as fp:
-            fp.write(res.text)
-    print(json.dumps(fake_table_to_list(res.text)))
+    print(json.dumps(forward_transaction(ctx, tx__)))
 
 
 @cli.group()
 @click.pass_context
 def token(ctx):
-    pass
+    if ctx.obj.get('timings', None):
+        ctx.obj['command'] = f"token {ctx.invoked_subcommand}"
+
+
+TOKEN_FEES_MAX_AGE = 300  # seconds
+TOKEN_TRANSFER_FEES = 1  # micro nyzos, sent to the cycle address or the recipient along token operations
+
+
+def get_token_fees(ctx) -> dict:
+    """Current token fees from the tokens API, {"issue_fees": ..., "mint_fees": ...} in micro nyzos.
+    Kept in the context for TOKEN_FEES_MAX_AGE seconds, so a serve process or a batch asks only once."""
+    cached = ctx.obj.get('token_fees', None)
+    if cached and cached[0] == ctx.obj['token'] and time() - cached[1] < TOKEN_FEES_MAX_AGE:
+        return cached[2]
+    fees = None
+    mirror_file = default_mirror_path(ctx.obj['token'])
+    if path.isfile(mirror_file):
+        # Synced by token sync
+        with TokenMirror(mirror_file) as mirror:
+            fees = mirror.fees(ctx.obj['token'], TOKEN_FEES_MAX_AGE)
+    if fees is None:
+        fees = fetch_token_fees(ctx)
+    ctx.obj['token_fees'] = (ctx.obj['token'], time(), fees)
+    return fees
+
+
+def fetch_token_fees(ctx) -> dict:
+    url = f"{ctx.obj['token']}/fees"
+    with timed(ctx, "token_fees"):
+        res = get_http(ctx).get(url)
+    return res.json()[-1]
+
+
+def fetch_token_balances(ctx, address: str) -> dict:
+    """All token balances of a hex address from the tokens API, {token: {"amount": ..., "decimals": ...}}"""
+    url = f"{ctx.obj['token']}/balances/{address}"
+    with timed(ctx, "token_balances"):
+        res = get_http(ctx).get(url)
+    res.raise_for_status()
+    return res.json()
+
+
+def check_token_tx(ctx, address: str, recipient: str, fees: int, data: str) -> str:
+    """Dry run of a token operation with fees micro nyzos by the tokens API, answer text has "Error:" if it would fail"""
+    url = f"{ctx.obj['token']}/check_tx/{address}/{recipient}/{fees / 1000000:0.6f}/{data}"
+    if VERBOSE:
+        print(url)
+    with timed(ctx, "token_check"):
+        return get_http(ctx).get(url).text
 
 
 @token.command("balance")
 @click.pass_context
 @click.argument('address',  default="", type=str)
 @click.argument('token_name',  default="", type=str)
-def token_balance(ctx, address: str="", token_name: str=""):
+@click.option('--mirror', '-m', 'use_mirror', is_flag=True, default=False,
+              help='Answer from the local mirror (see token sync), addresses not in it yet are fetched and added')
+@click.option('--file', '-f', 'address_file', type=click.File('r'), default=None,
+              help='Addresses to report, one a line, one json line each. Use - for stdin')
+@click.option('--token', '-T', 'token_filter', default="", help='Only report that token (same as TOKEN_NAME)')
+def token_balance(ctx, address: str="", token_name: str="", use_mirror: bool=False, address_file=None,
+                  token_filter: str=""):
     # ./Nyzocli.py token balance a49138f27485cae4096c3eb72f9425943fe4b6f346d0fc76ef40084ec767365d
     # ./Nyzocli.py token balance a49138f27485cae4096c3eb72f9425943fe4b6f346d0fc76ef40084ec767365d TEST2
+    # ./Nyzocli.py token balance --mirror -T TEST2 -f holders.txt
+    token_name = token_name or token_filter
+    mirror = None
+    if use_mirror:
+        mirror = TokenMirror(default_mirror_path(ctx.obj['token']))
+        ctx.call_on_close(mirror.close)
+    if address_file is not None:
+        addresses = chain([address] if address else [], (line.strip() for line in address_file if line.strip()))
+        for address in addresses:
+            try:
+                _, address = normalize_address(address, asHex=True)
+                balances = mirrored_token_balances(ctx, mirror, address) if mirror else fetch_token_balances(ctx, address)
+            except Exception as e:
+                print(json.dumps({"address": address, "error": str(e)}))
+                continue
+            if token_name != "":
+                balances = {token_name: balances.get(token_name, '0')}
+            print(json.dumps({"address": address, "balances": balances}))
+        return
     if address == '':
-        address = config.PUBLIC_KEY.to_bytes().hex()
+        address = wallet_address()
     else:
         address = address.replace('-', '')
     id__address, address = normalize_address(address, asHex=True)
-    url = f"{ctx.obj['token']}/balances/{address}"
-    res = get(url)
-    balances = res.json()
+    balances = mirrored_token_balances(ctx, mirror, address) if mirror else fetch_token_balances(ctx, address)
     if token_name != "":
         if ctx.obj['json']:
             print(json.dumps({token_name: balances.get(token_name, '0')}))
@@ -566,6 +1876,70 @@ def token_balance(ctx, address: str="", token_name: str=""):
                 print(f" {token}: {balances[token]['amount']}")
 
 
+def mirrored_token_balances(ctx, mirror: TokenMirror, address: str) -> dict:
+    """Token balances of a hex address from the mirror, fetched and added to it when not there yet"""
+    with timed(ctx, "token_mirror"):
+        found = mirror.balances(address)
+    if found is not None:
+        return found[0]
+    balances = fetch_token_balances(ctx, address)
+    mirror.update(address, balances)
+    return balances
+
+
+@token.command("sync")
+@click.pass_context
+@click.argument('addresses', nargs=-1, type=str)
+@click.option('--file', '-f', 'address_file', type=click.File('r'), default=None,
+              help='Also track the addresses of that file, one a line. Use - for stdin')
+@click.option('--max_age', default=300.0, help='Sync again the addresses older than this, in seconds (default 300)')
+@click.option('--workers', '-w', default=8, help='Concurrent tokens API requests (default 8)')
+def token_sync(ctx, addresses, address_file, max_age: float=300, workers: int=8):
+    """Updates the local mirror of token balances and fees, used by token balance --mirror.
+    ADDRESSES (and --file) are added to the tracked ones. Only tracked addresses synced more than --max_age seconds ago
+    are asked for again. Prints a json summary.
+    - ex: python3 Nyzocli.py token sync -f holders.txt
+    - ex: python3 Nyzocli.py token sync --max_age 60
+    """
+    if address_file is not None:
+        addresses = chain(addresses, (line.strip() for line in address_file if line.strip()))
+    start = time()
+    errors = []
+    fetched = 0
+    with TokenMirror(default_mirror_path(ctx.obj['token'])) as mirror:
+        new = []
+        for address in addresses:
+            try:
+                new.append(normalize_address(address, asHex=True)[1])
+            except ValueError as e:
+                errors.append({"address": address, "error": str(e)})
+        mirror.track(new)
+        if mirror.fees(ctx.obj['token'], max_age) is None:
+            try:
+                mirror.set_fees(ctx.obj['token'], fetch_token_fees(ctx))
+            except Exception as e:
+                errors.append({"fees": True, "error": str(e)})
+        stale = mirror.stale(max_age)
+
+        def fetch(address: str):
+            try:
+                return address, fetch_token_balances(ctx, address), time()
+            except Exception as e:
+                return address, e, 0
+
+        # Requests run in the pool, the mirror is written from here only.
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(stale)))) as executor:
+            for address, balances, synced_at in executor.map(fetch, stale):
+                if isinstance(balances, Exception):
+                    errors.append({"address": address, "error": str(balances)})
+                    continue
+                mirror.update(address, balances, synced_at)
+                fetched += 1
+        tracked = len(mirror.tracked())
+    print(json.dumps({"tracked": tracked, "stale": len(stale), "fetched": fetched, "errors": errors,
+                      "elapsed": round(time() - start, 3)}))
+
+
 @token.command("issue")
 @click.pass_context
 @click.argument('token_name', type=str)
@@ -574,13 +1948,9 @@ def token_balance(ctx, address: str="", token_name: str=""):
 @click.argument('key_', default="", type=str)
 def token_issue(ctx, token_name: str, decimals: int, supply: str, key_: str=""):
     # ./Nyzocli.py --verbose token issue -- TEST3 3 -1
-    if key_ == "":
-        seed = config.PRIVATE_KEY.to_bytes()
-        key_ = NyzoStringEncoder.encode(NyzoStringPrivateSeed.from_hex(seed.hex()))
-    else:
-        seed = NyzoStringEncoder.decode(key_).get_bytes()
-    key, pub = KeyUtil.get_from_private_seed(seed.hex())
-    address = pub.to_ascii(encoding="hex").decode('utf-8')
+    from modules.signing import get_keys
+    seed = seed_from_key(key_)
+    key, address = get_keys(seed)
     if decimals < 0:
         raise ValueError("Decimals have to be >= 0")
     if decimals > 18:
@@ -593,28 +1963,22 @@ def token_issue(ctx, token_name: str, decimals: int, supply: str, key_: str=""):
     if VERBOSE:
         print(f"token issue {token_name} decimals {dec} supply {supply}")
     data = f"TI:{token_name}:d{dec}:{supply}"
-    # get fees
-    url = f"{ctx.obj['token']}/fees"
-    res = get(url)
-    fees = res.json()
-    issue_fees = fees[-1]["issue_fees"]  # micro_nyzos
-    amount = issue_fees / 1000000
+    issue_fees = get_token_fees(ctx)["issue_fees"]  # micro_nyzos
     if VERBOSE:
         print(f"Issue fees are {issue_fees} micro nyzos.")
     # Test via API
     recipient = CYCLE_ADDRESS_HEX
-    url = f"{ctx.obj['token']}/check_tx/{address}/{recipient}/{amount:0.6f}/{data}"
+    url = f"{ctx.obj['token']}/check_tx/{address}/{recipient}/{issue_fees / 1000000:0.6f}/{data}"
     if VERBOSE:
         print(url)
-    res = get(url).text
+    res = get_http(ctx).get(url).text
     if VERBOSE:
         print(res)
     if "Error:" in res:
         print(res)
     else:
         # Assemble, sign and forward if ok
-        client = NyzoClient(ctx.obj['client'])
-        res = client.send(recipient, amount, data, key_)
+        res = send_transaction(ctx, key, address, recipient, issue_fees, data)
         print(res)
 
 
@@ -625,13 +1989,9 @@ def token_issue(ctx, token_name: str, decimals: int, supply: str, key_: str=""):
 @click.argument('key_', default="", type=str)
 def token_mint(ctx, token_name: str, amount: str, key_: str=""):
     # ./Nyzocli.py --verbose token mint TEST3 100
-    if key_ == "":
-        seed = config.PRIVATE_KEY.to_bytes()
-        key_ = NyzoStringEncoder.encode(NyzoStringPrivateSeed.from_hex(seed.hex()))
-    else:
-        seed = NyzoStringEncoder.decode(key_).get_bytes()
-    key, pub = KeyUtil.get_from_private_seed(seed.hex())
-    address = pub.to_ascii(encoding="hex").decode('utf-8')
+    from modules.signing import get_keys
+    seed = seed_from_key(key_)
+    key, address = get_keys(seed)
     if float(amount) <= 0:
         raise ValueError("Amount has to be > 0")
     if not re.match(r"[0-9A-Z_]{3,32}", token_name):
@@ -639,28 +1999,23 @@ def token_mint(ctx, token_name: str, amount: str, key_: str=""):
     if VERBOSE:
         print(f"token mint {token_name} amount {amount}")
     data = f"TM:{token_name}:{amount}"
-    url = f"{ctx.obj['token']}/fees"
-    # get fees
-    res = get(url)
-    fees = res.json()
-    mint_fees = fees[-1]["mint_fees"]  # micro_nyzos
-    fees = mint_fees / 1000000
+    mint_fees = get_token_fees(ctx)["mint_fees"]  # micro_nyzos
+    fees = mint_fees
     if VERBOSE:
         print(f"Issue fees are {mint_fees} micro nyzos.")
     # Test via API
     recipient = CYCLE_ADDRESS_HEX
-    url = f"{ctx.obj['token']}/check_tx/{address}/{recipient}/{fees:0.6f}/{data}"
+    url = f"{ctx.obj['token']}/check_tx/{address}/{recipient}/{fees / 1000000:0.6f}/{data}"
     if VERBOSE:
         print(url)
-    res = get(url).text
+    res = get_http(ctx).get(url).text
     if VERBOSE:
         print(res)
     if "Error:" in res:
         print(res)
     else:
         # Assemble, sign and forward if ok
-        client = NyzoClient(ctx.obj['client'])
-        res = client.send(recipient, fees, data, key_)
+        res = send_transaction(ctx, key, address, recipient, fees, data)
         print(res)
 
 
@@ -671,13 +2026,9 @@ def token_mint(ctx, token_name: str, amount: str, key_: str=""):
 @click.argument('key_', default="", type=str)
 def token_burn(ctx, token_name: str, amount: str, key_: str=""):
     # ./Nyzocli.py --verbose token burn TEST3 1.12345
-    if key_ == "":
-        seed = config.PRIVATE_KEY.to_bytes()
-        key_ = NyzoStringEncoder.encode(NyzoStringPrivateSeed.from_hex(seed.hex()))
-    else:
-        seed = NyzoStringEncoder.decode(key_).get_bytes()
-    key, pub = KeyUtil.get_from_private_seed(seed.hex())
-    address = pub.to_ascii(encoding="hex").decode('utf-8')
+    from modules.signing import get_keys
+    seed = seed_from_key(key_)
+    key, address = get_keys(seed)
     if float(amount) <= 0:
         raise ValueError("Amount has to be > 0")
     if not re.match(r"[0-9A-Z_]{3,32}", token_name):
@@ -685,21 +2036,20 @@ def token_burn(ctx, token_name: str, amount: str, key_: str=""):
     if VERBOSE:
         print(f"token burn {token_name} amount {amount}")
     data = f"TB:{token_name}:{amount}"
-    fees = 0.000001
+    fees = TOKEN_TRANSFER_FEES
     # Test via API
     recipient = CYCLE_ADDRESS_HEX
-    url = f"{ctx.obj['token']}/check_tx/{address}/{recipient}/{fees:0.6f}/{data}"
+    url = f"{ctx.obj['token']}/check_tx/{address}/{recipient}/{fees / 1000000:0.6f}/{data}"
     if VERBOSE:
         print(url)
-    res = get(url).text
+    res = get_http(ctx).get(url).text
     if VERBOSE:
         print(res)
     if "Error:" in res:
         print(res)
     else:
         # Assemble, sign and forward if ok
-        client = NyzoClient(ctx.obj['client'])
-        res = client.send(recipient, fees, data, key_)
+        res = send_transaction(ctx, key, address, recipient, fees, data)
         print(res)
 
 
@@ -711,33 +2061,170 @@ def token_burn(ctx, token_name: str, amount: str, key_: str=""):
 @click.argument('key_', default="", type=str)
 def token_send(ctx, recipient: str, amount: str, token_name: str, key_: str=""):
     # ./Nyzocli.py --verbose token send 3f19e603b9577b6f91d4c84531e1e94e946aa172063ea3a88efb26e3fe75bb84 1.123 TEST3
-    if key_ == "":
-        seed = config.PRIVATE_KEY.to_bytes()
-        key_ = NyzoStringEncoder.encode(NyzoStringPrivateSeed.from_hex(seed.hex()))
-    else:
-        seed = NyzoStringEncoder.decode(key_).get_bytes()
-    key, pub = KeyUtil.get_from_private_seed(seed.hex())
-    address = pub.to_ascii(encoding="hex").decode('utf-8')
+    from modules.signing import get_keys
+    seed = seed_from_key(key_)
+    key, address = get_keys(seed)
     id__recipient, recipient = normalize_address(recipient, asHex=True)
     print(f"token transfer {token_name} amount {amount} to {recipient}")
     data = f"TT:{token_name}:{amount}"
-    fees = 0.000001
+    fees = TOKEN_TRANSFER_FEES
     # Test via API
-    url = f"{ctx.obj['token']}/check_tx/{address}/{recipient}/{fees:0.6f}/{data}"
+    url = f"{ctx.obj['token']}/check_tx/{address}/{recipient}/{fees / 1000000:0.6f}/{data}"
     if VERBOSE:
         print(url)
-    res = get(url).text
+    res = get_http(ctx).get(url).text
     if VERBOSE:
         print(res)
     if "Error:" in res:
         print(res)
     else:
         # Assemble, sign and forward if ok
-        client = NyzoClient(ctx.obj['client'])
-        res = client.send(recipient, fees , data, key_)
+        res = send_transaction(ctx, key, address, recipient, fees, data)
         print(res)
 
 
+def check_and_forward_token_row(ctx, address: str, row: dict) -> dict:
+    """Has the tokens API check a signed token transfer row, then forwards it if ok"""
+    try:
+        res = check_token_tx(ctx, address, row["recipient_raw"], TOKEN_TRANSFER_FEES, row["data"])
+    except Exception as e:
+        res = f"Error: {e}"
+    del row["recipient_raw"]
+    if "Error:" in res:
+        row["result"], row["error"] = "Error", res.strip()
+        return row
+    return forward_row(ctx, row)
+
+
+@token.command("send-batch")
+@click.pass_context
+@click.argument('file', type=click.File('r'))
+@click.argument('key_', default="", type=str)
+@click.option('--token', '-T', 'token_name', default='', help='Token of the rows that do not name one')
+@click.option('--workers', '-w', default=8, help='Max concurrent checks and forwards (default 8)')
+@click.option('--max_age', '-m', default=30, help='Refresh the frozen edge once older than this, in seconds (default 30)')
+@click.option('--output', '-o', default='',
+              help='JSONL result log to append to. A new run skips the rows already Ok in it, '
+                   'and re-sends the same tx for the others (default stdout)')
+def token_send_batch(ctx, file, key_: str="", token_name: str="", workers: int=8, max_age: int=30, output: str=""):
+    """
+    Send tokens to every recipient of a FILE, with one JSON result line per row.
+    FILE has one transfer a line, either CSV "recipient,amount[,token]" or JSON {"recipient":..., "amount":..., "token":...}
+    Use - as FILE to read from stdin. If no seed is given, use the wallet one.
+    - ex: python3 Nyzocli.py token send-batch -T TEST3 airdrop.csv
+    - ex: python3 Nyzocli.py token send-batch -w 16 -o airdrop_results.jsonl airdrop.jsonl key_...
+    """
+    from modules.signing import SigningEngine, encode_standard, get_keys, standard_transaction, transaction_timestamp
+    seed = seed_from_key(key_)
+    _, address = get_keys(seed)
+    done = set()
+    # line -> (tx__, recipient, data) of the rows a previous run signed, but did not see Ok.
+    # The tx may have landed all the same: it is sent again as is, never signed anew while it can still make it.
+    signed = {}
+    if output:
+        if path.isfile(output):
+            with open(output) as fp:
+                for line in fp:
+                    try:
+                        result = json.loads(line)
+                    except ValueError:
+                        continue
+                    if result.get("result") == "Ok":
+                        done.add(result["line"])
+                        signed.pop(result["line"], None)
+                    elif result.get("tx__"):
+                        signed[result["line"]] = (result["tx__"], result.get("recipient"), result.get("data"))
+        log = open(output, "a")
+    else:
+        log = sys.stdout
+    # Rows to resume are sorted out against the current edge, not a cached one
+    frozen = get_frozen(ctx, max_age=0 if signed else None)
+    frozen_at = time()
+    if not frozen.get('height'):
+        print(json.dumps({"result": "Error", "reason": "Unable to get frozen edge"}))
+        return
+    valid_tokens = set()
+    counts = {"Ok": 0, "Error": 0}
+
+    def prepared_rows() -> Iterator[dict]:
+        """The rows to send, checked, and sorted out against a previous run"""
+        nonlocal frozen, frozen_at
+        for row in read_token_rows(file, token_name):
+            if row["line"] in done:
+                continue
+            if "error" not in row:
+                try:
+                    if row["token"] not in valid_tokens:
+                        if not re.fullmatch(r"[0-9A-Z_]{3,32}", row["token"]):
+                            raise ValueError(f"Token name '{row['token']}' does not follow rules")
+                        valid_tokens.add(row["token"])
+                    if Decimal(row["amount"]) <= 0:
+                        raise ValueError("Amount has to be > 0")
+                    row["recipient"], row["recipient_raw"] = normalize_address(row["recipient"], asHex=True)
+                    row["data"] = f"TT:{row['token']}:{row['amount']}"
+                    if time() - frozen_at > max_age:
+                        frozen = get_frozen(ctx, max_age=max_age)
+                        frozen_at = time()
+                    previous = signed.pop(row["line"], None)
+                    if previous and previous[1:] == (row["recipient"], row["data"]):
+                        tx__ = previous[0]
+                        if not tx_expired(transaction_timestamp(tx__), frozen):
+                            # Same tx again: it can only be included once
+                            row["tx__"], row["resent"] = tx__, True
+                        else:
+                            # Too late for that tx: only if it did not make it, sign a new one
+                            height = search_transaction(ctx, tx__)
+                            if height:
+                                row.pop("recipient_raw")
+                                row.update(tx__=tx__, result="Ok", height=height)
+                except Exception as e:
+                    row["error"] = str(e)
+            yield row
+
+    def build(row: dict, timestamp: int) -> Union[bytes, None]:
+        if "tx__" in row:
+            # Sent again as is, or already in the chain
+            return None
+        # The edge may be refreshed before the signature is back
+        row["frozen"] = frozen
+        return standard_transaction(address, row["recipient_raw"], TOKEN_TRANSFER_FEES, row["data"], frozen,
+                                    timestamp).get_bytes(for_signing=True)
+
+    def encode(row: dict, signature: bytes) -> str:
+        return encode_standard(address, row["recipient_raw"], TOKEN_TRANSFER_FEES, row["data"], row.pop("frozen"),
+                               row["timestamp"], signature)
+
+    # Same pipeline as send-batch: rows are signed by the engine, checked and forwarded by the pool, logged in order.
+    pending = deque()
+    try:
+        with SigningEngine([seed], chunk_size=BATCH_SIGN_CHUNK) as engine, \
+                ThreadPoolExecutor(max_workers=workers) as executor:
+            # Signing processes are forked before the first forward starts a thread
+            engine.start()
+            for row in signed_rows(engine, prepared_rows(), build, encode, live=True,
+                                   timer=obj_timer(ctx.obj)):
+                if "result" in row:
+                    # Found in the chain from a previous run
+                    pending.append(row)
+                elif "error" in row:
+                    row.pop("recipient_raw", None)
+                    row.pop("frozen", None)
+                    row["result"] = "Error"
+                    pending.append(row)
+                else:
+                    pending.append(executor.submit(check_and_forward_token_row, ctx, address, row))
+                while len(pending) >= 2 * workers:
+                    write_batch_result(pending.popleft(), log, counts)
+            while pending:
+                write_batch_result(pending.popleft(), log, counts)
+    finally:
+        if output:
+            log.close()
+    if VERBOSE:
+        app_log.info(f"Token batch done from {address}: {counts['Ok']} Ok, {counts['Error']} Error, "
+                     f"{len(done)} already done.")
+
+
 @token.command("ownership")
 @click.pass_context
 @click.argument('token_name', type=str)
@@ -745,49 +2232,161 @@ def token_send(ctx, recipient: str, amount: str, token_name: str, key_: str=""):
 @click.argument('key_', default="", type=str)
 def token_ownership(ctx, token_name: str,  recipient: str, key_: str=""):
     # ./Nyzocli.py --verbose token ownership TEST3 3f19e603b9577b6f91d4c84531e1e94e946aa172063ea3a88efb26e3fe75bb84
-    if key_ == "":
-        seed = config.PRIVATE_KEY.to_bytes()
-        key_ = NyzoStringEncoder.encode(NyzoStringPrivateSeed.from_hex(seed.hex()))
-    else:
-        seed = NyzoStringEncoder.decode(key_).get_bytes()
-    key, pub = KeyUtil.get_from_private_seed(seed.hex())
-    address = pub.to_ascii(encoding="hex").decode('utf-8')
+    from modules.signing import get_keys
+    seed = seed_from_key(key_)
+    key, address = get_keys(seed)
     id__recipient, recipient = normalize_address(recipient, asHex=True)
     print(f"token ownership transfer {token_name} to {recipient}")
     data = f"TO:{token_name}"
-    fees = 0.000001
+    fees = TOKEN_TRANSFER_FEES
     # Test via API
-    url = f"{ctx.obj['token']}/check_tx/{address}/{recipient}/{fees:0.6f}/{data}"
+    url = f"{ctx.obj['token']}/check_tx/{address}/{recipient}/{fees / 1000000:0.6f}/{data}"
     if VERBOSE:
         print(url)
-    res = get(url).text
+    res = get_http(ctx).get(url).text
     if VERBOSE:
         print(res)
     if "Error:" in res:
         print("E", res)
     else:
         # Assemble, sign and forward if ok
-        client = NyzoClient(ctx.obj['client'])
-        res = client.send(recipient, fees , data, key_)
+        res = send_transaction(ctx, key, address, recipient, fees, data)
         print(res)
 
 
+# What a serve process keeps warm across commands, the rest of the context obj comes from each command options
+SHARED_OBJ_KEYS = ('http', 'verifier_pool', 'verifiers_checked', 'client_reader', 'nyzo_client', 'token_fees')
+
+
+def run_rpc_command(shared: dict, request: dict) -> dict:
+    """Runs one cli command for the serve process, in the caller's directory,
+    with its own stdin and captured stdout and stderr - logs included"""
+    global VERBOSE
+    args = [str(arg) for arg in request.get("args", [])]
+    command = local_command(args)
+    if command:
+        return {"exit_code": 1, "output": "", "error": f"{command} can't be forwarded, run it without {SOCKET_ENV}"}
+    stdout = io.TextIOWrapper(io.BytesIO(), encoding='utf-8')
+    stderr = io.StringIO()
+    stdin = io.TextIOWrapper(io.BytesIO(request.get("stdin", "").encode('utf-8')), encoding='utf-8')
+    exit_code, error = 0, None
+    real_cwd = getcwd()
+    try:
+        chdir(request.get("cwd") or real_cwd)
+    except OSError as e:
+        return {"exit_code": 1, "output": "", "error": f"Can't run in {request.get('cwd')}: {e}"}
+    obj = {key: shared[key] for key in SHARED_OBJ_KEYS if key in shared}
+    real_verbose = VERBOSE
+    real_stdin, sys.stdin = sys.stdin, stdin
+    # The log handlers hold the real stderr, not sys.stderr
+    handlers = [handler for handler in logging.getLogger().handlers
+                if isinstance(handler, logging.StreamHandler) and handler.stream is sys.stderr]
+    for handler in handlers:
+        handler.setStream(stderr)
+    try:
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                exit_code = cli.main(args=args, prog_name="Nyzocli.py", obj=obj, standalone_mode=False) or 0
+                if not isinstance(exit_code, int):
+                    # Command return value
+                    exit_code = 0
+            except click.ClickException as e:
+                error, exit_code = e.format_message(), e.exit_code
+            except click.Abort:
+                error, exit_code = "Aborted", 1
+            except SystemExit as e:
+                exit_code = e.code if isinstance(e.code, int) else 1
+            except Exception as e:
+                error, exit_code = f"{type(e).__name__}: {e}", 1
+    finally:
+        VERBOSE = real_verbose
+        sys.stdin = real_stdin
+        for handler in handlers:
+            handler.setStream(sys.stderr)
+        chdir(real_cwd)
+    if obj.get('http', None) is shared['http']:
+        # Unless the command had a transport of its own: what it built on that one is closed by now
+        for key in SHARED_OBJ_KEYS:
+            if key in obj:
+                shared[key] = obj[key]
+    stdout.flush()
+    answer = {"exit_code": exit_code, "output": stdout.buffer.getvalue().decode('utf-8'), "stderr": stderr.getvalue()}
+    if error:
+        answer["error"] = error
+    return answer
+
+
+@cli.command()
+@click.pass_context
+@click.option('--socket', 'socket_path', default='', help='Unix socket to listen on (default: nyzocli.sock in private dir)')
+def serve(ctx, socket_path):
+    """Run as a resident process serving Nyzocli commands over a local Unix socket.
+    Keys, http sessions and caches stay loaded from one command to the next, commands run one at a time.
+    Nyzocli forwards its commands there when the NYZOCLI_SOCKET env var points to that socket.
+    follow and watch-balance, that run until stopped, always run locally.
+    - ex: python3 Nyzocli.py serve
+    - ex: NYZOCLI_SOCKET=~/nyzo-private/nyzocli.sock python3 Nyzocli.py --json vbalance
+    """
+    socket_path = socket_path or default_socket_path(get_private_dir())
+    if path.exists(socket_path):
+        if rpc_call(socket_path, ["version"]) is not None:
+            app_log.error(f"A serve process already listens on {socket_path}")
+            return
+        # Left over by a killed process
+        remove(socket_path)
+    # Everything in there is kept warm across commands
+    shared = {'http': get_http(ctx), 'verifier_pool': VerifierPool(), 'verifiers_checked': set()}
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # The process holds the keys, only the user may talk to it: the socket is created 0600 right away
+    previous_umask = umask(0o177)
+    try:
+        server.bind(socket_path)
+    finally:
+        umask(previous_umask)
+    server.listen(16)
+
+    def stop(signum, frame):
+        # Same way out as ctrl-c, so the socket file is removed
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGHUP, stop)
+    app_log.info(f"Serving on {socket_path}")
+    try:
+        while True:
+            connection, _ = server.accept()
+            with connection:
+                try:
+                    request = read_message(connection)
+                    if VERBOSE:
+                        app_log.info(f"Running {request.get('args')}")
+                    answer = run_rpc_command(shared, request)
+                except Exception as e:
+                    answer = {"exit_code": 1, "output": "", "error": str(e)}
+                try:
+                    write_message(connection, answer)
+                except OSError as e:
+                    app_log.warning(f"Could not answer: {e}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        shared['verifier_pool'].close()
+        remove(socket_path)
+
+
 if __name__ == '__main__':
     logger = logging.getLogger('push')
 
     app_log = logging.getLogger()
     app_log.setLevel(logging.INFO)
 
-    ch = logging.StreamHandler(sys.stdout)
+    # Logs go to stderr, stdout is for results (json lines of blocks, follow...)
+    ch = logging.StreamHandler(sys.stderr)
     ch.setLevel(logging.DEBUG)
     formatter = logging.Formatter('%(asctime)s [%(levelname)-5s] %(message)s')
     ch.setFormatter(formatter)
     app_log.addHandler(ch)
 
-    # Use user private dir
-    private_dir = get_private_dir()
-    config.NYZO_SEED = private_dir + '/private_seed'
-    config.load(private_dir)
-
     cli(obj={})
 
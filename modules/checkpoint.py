@@ -0,0 +1,31 @@
+"""
+Small json checkpoint files, for the commands that resume where they stopped (follow).
+
+Writes are atomic (see helpers.atomic_write), a crash leaves the previous checkpoint.
+"""
+
+import json
+from os import path
+from time import time
+from typing import Union
+
+from modules.helpers import atomic_write, get_private_dir
+
+
+def default_checkpoint_path(name: str) -> str:
+    return path.join(get_private_dir(), f"{name}_checkpoint.json")
+
+
+def read_checkpoint(file_name: str) -> Union[dict, None]:
+    """Last saved checkpoint, None if there is none or it can not be read"""
+    try:
+        with open(file_name) as fp:
+            return json.load(fp)
+    except Exception:
+        return None
+
+
+def write_checkpoint(file_name: str, data: dict) -> None:
+    """Saves the checkpoint, atomically, with the time it was saved at"""
+    with atomic_write(file_name) as fp:
+        json.dump({**data, "saved_at": round(time(), 3)}, fp)
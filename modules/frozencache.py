@@ -0,0 +1,40 @@
+"""
+On-disk frozen edge cache, shared by all Nyzocli invocations.
+
+One small json file per client url in the user private dir.
+Writes are atomic (see helpers.atomic_write), so concurrent processes
+only ever read a complete previous or new version.
+"""
+
+import json
+from hashlib import sha1
+from os import path
+from time import time
+from typing import Union
+
+from modules.helpers import atomic_write, get_private_dir
+
+
+def frozen_cache_path(client: str) -> str:
+    """Cache file for a given client url"""
+    digest = sha1(client.encode('utf-8')).hexdigest()[:16]
+    return path.join(get_private_dir(), f"frozen_edge_{digest}.json")
+
+
+def read_frozen_cache(client: str, max_age: float) -> Union[dict, None]:
+    """Returns the cached frozen edge of that client if fetched less than max_age seconds ago, None otherwise"""
+    try:
+        with open(frozen_cache_path(client)) as fp:
+            cached = json.load(fp)
+        if cached.get("client") != client or time() - cached["fetched_at"] > max_age:
+            return None
+        return cached["frozen"]
+    except Exception:
+        # Missing, partial or old format: same as no cache
+        return None
+
+
+def write_frozen_cache(client: str, frozen: dict) -> None:
+    """Stores the frozen edge of that client, atomically"""
+    with atomic_write(frozen_cache_path(client)) as fp:
+        json.dump({"client": client, "fetched_at": time(), "frozen": frozen}, fp)
@@ -0,0 +1,161 @@
+"""
+Hedged reads over several nyzo web clients, for idempotent GETs (/frozenEdge, /balance).
+
+The request goes to the endpoint with the best recent tail latency. If no answer came after the usual
+p95 latency of that endpoint, the same request goes to the next one, and the first good answer wins.
+At most two requests per read, so the extra load stays around 5%.
+
+Recent latencies are kept by endpoint - failures and requests still running at exit count as the full timeout -
+and saved in the private dir, so the ranking carries from one run to the next.
+With a single endpoint there is nothing to hedge nor rank: the callers GET it directly.
+"""
+
+import queue
+import threading
+from collections import deque
+from math import ceil
+from time import perf_counter
+from typing import Callable, Tuple
+
+from modules.checkpoint import read_checkpoint, write_checkpoint
+
+
+def percentile(samples: list, fraction: float) -> float:
+    """Nearest rank percentile of a non empty list"""
+    ordered = sorted(samples)
+    return ordered[max(0, min(len(ordered) - 1, ceil(fraction * len(ordered)) - 1))]
+
+
+class HedgedReader:
+    """Sends GETs to the fastest of several endpoints, with a hedge to a second one. Thread safe."""
+
+    def __init__(self, endpoints: list, get: Callable, failure_latency: float=30.0, stats_file: str='',
+                 window: int=64, min_samples: int=5, default_delay: float=0.3, min_delay: float=0.05,
+                 max_delay: float=2.0):
+        self.endpoints = list(endpoints)
+        # Same signature as requests.get
+        self._get = get
+        self.failure_latency = failure_latency
+        self.stats_file = stats_file
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.counts = {"reads": 0, "hedged": 0, "hedge_wins": 0}
+        self._samples = {endpoint: deque(maxlen=window) for endpoint in self.endpoints}
+        self._running = {}  # request id -> (endpoint, start)
+        self._dirty = False
+        self._lock = threading.Lock()
+        if stats_file:
+            saved = read_checkpoint(stats_file) or {}
+            for endpoint, samples in saved.get("latencies", {}).items():
+                if endpoint in self._samples:
+                    self._samples[endpoint].extend(samples)
+
+    def record(self, endpoint: str, seconds: float) -> None:
+        with self._lock:
+            self._samples[endpoint].append(round(seconds, 4))
+            self._dirty = True
+
+    def ranked(self) -> list:
+        """Endpoints by recent p95 latency. Endpoints without enough samples come first, to be measured."""
+        with self._lock:
+            keys = {endpoint: percentile(samples, 0.95) if len(samples) >= self.min_samples else 0
+                    for endpoint, samples in self._samples.items()}
+        return sorted(self.endpoints, key=lambda endpoint: keys[endpoint])
+
+    def hedge_delay(self, endpoint: str) -> float:
+        """How long to wait on that endpoint before asking another one: its recent p95"""
+        with self._lock:
+            samples = list(self._samples[endpoint])
+        if len(samples) < self.min_samples:
+            return self.default_delay
+        return min(max(percentile(samples, 0.95), self.min_delay), self.max_delay)
+
+    def _request(self, endpoint: str, path: str, results: queue.Queue, kwargs: dict) -> None:
+        key = object()
+        start = perf_counter()
+        with self._lock:
+            self._running[key] = (endpoint, start)
+        try:
+            answer = self._get(endpoint + path, **kwargs)
+            ok = answer.status_code == 200
+        except Exception as e:
+            answer, ok = e, False
+        elapsed = perf_counter() - start
+        with self._lock:
+            del self._running[key]
+        self.record(endpoint, elapsed if ok else max(elapsed, self.failure_latency))
+        results.put((endpoint, answer, ok))
+
+    def _start(self, endpoint: str, path: str, results: queue.Queue, kwargs: dict) -> None:
+        # Daemon: a losing request still running does not hold the process at exit
+        threading.Thread(target=self._request, args=(endpoint, path, results, kwargs), daemon=True).start()
+
+    def get(self, path: str, **kwargs) -> Tuple[str, object]:
+        """GETs endpoint + path, returns (endpoint, response) of the first 200 answer.
+        If none, the last answer, or raises the last error."""
+        ranked = self.ranked()
+        with self._lock:
+            self.counts["reads"] += 1
+        results = queue.Queue()
+        self._start(ranked[0], path, results, kwargs)
+        pending = 1
+        try:
+            first = results.get(timeout=self.hedge_delay(ranked[0]))
+            pending -= 1
+        except queue.Empty:
+            first = None
+        if len(ranked) > 1 and (first is None or not first[2]):
+            # Primary slow or failed
+            with self._lock:
+                self.counts["hedged"] += 1
+            self._start(ranked[1], path, results, kwargs)
+            pending += 1
+        last = first
+        while (last is None or not last[2]) and pending:
+            last = results.get()
+            pending -= 1
+        endpoint, answer, ok = last
+        if ok and endpoint != ranked[0]:
+            with self._lock:
+                self.counts["hedge_wins"] += 1
+        if isinstance(answer, Exception):
+            raise answer
+        return endpoint, answer
+
+    def probe(self, path: str, **kwargs) -> None:
+        """Sends the GET to every endpoint at once, to measure them all"""
+        results = queue.Queue()
+        for endpoint in self.endpoints:
+            self._start(endpoint, path, results, kwargs)
+        for _ in self.endpoints:
+            results.get()
+
+    def report(self) -> list:
+        """Per endpoint latency summary, in ranking order"""
+        lines = []
+        for endpoint in self.ranked():
+            with self._lock:
+                samples = list(self._samples[endpoint])
+            line = {"endpoint": endpoint, "samples": len(samples), "hedge_delay": round(self.hedge_delay(endpoint), 4)}
+            if samples:
+                line.update({"p50": percentile(samples, 0.5), "p95": percentile(samples, 0.95),
+                             "p99": percentile(samples, 0.99), "max": max(samples)})
+            lines.append(line)
+        return lines
+
+    def save(self) -> None:
+        """Saves the recent latencies. Requests still running count as failures, the endpoint may be hung."""
+        if not self.stats_file or not (self._dirty or self._running):
+            return
+        with self._lock:
+            self._dirty = False
+            latencies = {endpoint: list(samples) for endpoint, samples in self._samples.items()}
+            for endpoint, _ in self._running.values():
+                latencies[endpoint].append(round(self.failure_latency, 4))
+            # Keep what other runs measured on endpoints this one does not use
+            saved = read_checkpoint(self.stats_file) or {}
+            for endpoint, samples in saved.get("latencies", {}).items():
+                latencies.setdefault(endpoint, samples)
+        write_checkpoint(self.stats_file, {"latencies": latencies})
@@ -1,5 +1,13 @@
+import csv
+import json
 import sys
-from os import path, makedirs
+from collections import deque
+from contextlib import contextmanager
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from html import unescape
+from os import chmod, fsync, path, makedirs, remove, replace, umask, SEEK_END
+from typing import Iterable, Iterator, Union
 
 # from xml.dom.minidom import parseString, getDOMImplementation
 # import xml.etree.ElementTree as ET
@@ -20,6 +28,35 @@ def get_private_dir():
     return location
 
 
+@contextmanager
+def atomic_write(file_name: str, mode: str="w", permissions: Union[int, None]=None):
+    """Writes a file through a temp file in the same dir, synced then renamed over the target.
+    Readers - and a crash - only ever see the complete previous or new version.
+    The temp file - so the target - is 0600, unless permissions are given (the umask still applies)."""
+    # tempfile pulls random and shutil in, not worth it at every Nyzocli start
+    from tempfile import NamedTemporaryFile
+    with NamedTemporaryFile(mode, dir=path.dirname(path.abspath(file_name)),
+                            prefix=f".{path.basename(file_name)}_", suffix=".tmp", delete=False) as fp:
+        try:
+            if permissions is not None:
+                # Only way to read the umask is to set it
+                current_umask = umask(0)
+                umask(current_umask)
+                chmod(fp.name, permissions & ~current_umask)
+            yield fp
+            fp.flush()
+            fsync(fp.fileno())
+        except BaseException:
+            fp.close()
+            remove(fp.name)
+            raise
+    try:
+        replace(fp.name, file_name)
+    except Exception:
+        remove(fp.name)
+        raise
+
+
 def base_path():
     """Returns the full path to the current dir, whether the app is frozen or not."""
     if getattr(sys, 'frozen', False):
@@ -44,50 +81,300 @@ def extract_status_lines(status: list, key:str) -> list:
             return value.split(' ')
 
 
-def fake_table_to_list(html: str):
-    #
-    test_header = re.search(r'<div class="header-row">([^"]*)</div><div class="data-row">', html)
-    headers = []
-    if test_header:
-        headers = test_header.groups()[0].replace('<div>', '').split("</div>")[:-1]  # closing /div
-    test_content = re.search(r'<div class="data-row">(.*)</div></div></div>', html)
-    try:
-        error_content = re.search(r'<p class="error">(.*)</p>', html).groups()[0]
-    except Exception:
-        error_content = None
-    values = []
-    if test_content:
-        content = test_content.groups()[0].replace('<div>', '')\
-            .replace('<div class="extra-wrap">', '') \
-            .replace('<div class="data-row">', '') \
-            .split("</div>")
-        while len(content) >= len(headers):
-            part = content[0:len(headers)]
-            content = content[len(headers)+1:]
-            values.append(dict(zip(headers, part)))
-    if error_content:
-        values.append({"error": error_content})
-    return values
+def find_balance_item(items: list, identifier: bytes):
+    """Binary search of an identifier in balance list items, that nyzo keeps sorted by identifier.
+    Returns the BalanceListItem, or None if the identifier is not in the list."""
+    low, high = 0, len(items)
+    while low < high:
+        middle = (low + high) // 2
+        # Identifiers may be memoryviews, that do not compare.
+        if bytes(items[middle].get_identifier()) < identifier:
+            low = middle + 1
+        else:
+            high = middle
+    if low < len(items) and bytes(items[low].get_identifier()) == identifier:
+        return items[low]
+    return None
+
+
+# Rows start with the client's exact markup, so the regex engine jumps from row to row.
+# Cells are the <div> children of a row, they may hold inline tags but no other div.
+FAKE_TABLE_HEADER = '<div class="header-row">'
+FAKE_TABLE_DATA = '<div class="data-row">'
+FAKE_TABLE_CELL_TEXT = r'[^<]*(?:<(?!/?div\b)[^<]*)*'
+FAKE_TABLE_CELLS = r'((?:\s*<div\b[^>]*>' + FAKE_TABLE_CELL_TEXT + r'</div>)*\s*</div>)'
+FAKE_TABLE_ROW_CELLS = re.compile(FAKE_TABLE_CELLS)
+FAKE_TABLE_CELL = re.compile(r'<div\b[^>]*>(' + FAKE_TABLE_CELL_TEXT + r')</div>')
+FAKE_TABLE_ERROR = re.compile(r'<p class="error">([^<]*(?:<(?!/p>)[^<]*)*)</p>')
+FAKE_TABLE_TAG = re.compile(r'<[^>]*>')
+
+
+@lru_cache(maxsize=16)
+def fake_table_data_row(columns: int):
+    """Data row regex for that many plain text cells, their texts as groups.
+    Other rows - inline tags, another cell count - match the last group, all their cells."""
+    plain = r'\s*<div\b[^>]*>([^<]*)</div>' * columns
+    return re.compile(re.escape(FAKE_TABLE_DATA) + r'(?:' + plain + r'\s*</div>|' + FAKE_TABLE_CELLS + ')')
+
+
+def fake_table_cells(cells: str) -> list:
+    """Cell texts of the inside of a row, inline tags dropped"""
+    return [FAKE_TABLE_TAG.sub('', cell) if '<' in cell else cell for cell in FAKE_TABLE_CELL.findall(cells)]
+
+
+@lru_cache(maxsize=64)
+def fake_table_layout(header_cells: str) -> tuple:
+    """(headers, data row regex) for the inside of a header row. All pages of a kind share them."""
+    headers = fake_table_cells(header_cells)
+    return headers, fake_table_data_row(len(headers))
+
+
+class FakeTableParser:
+    """Single pass parser for the client web UI "fake tables":
+    a <div class="header-row"> then <div class="data-row"> rows, one <div> cell per column,
+    and maybe a <p class="error"> paragraph.
+    Data rows with no header row - the frozen edge layout - are name/value pairs, kept in .fields.
+    Cell texts are kept as sent, inline tags in a cell are dropped.
+    Once the header told the column count, one regex gives the cells of every row: a whole page is a single findall.
+    Can be fed by chunks, completed rows pile up in .rows until consumed."""
+
+    def __init__(self):
+        self.headers = None
+        self.rows = deque()
+        self.fields = {}
+        self.errors = []
+        self._data_row = None  # data row regex, once the first row told the layout
+        self._pending = ''  # unparsed tail of the last chunk, from the last row start
+
+    def feed(self, chunk: str) -> None:
+        text = self._pending + chunk
+        # Rows before the last row start are complete, the last one may not be
+        last = text.rfind('-row')
+        cut = max(text.rfind('<', 0, last), 0) if last > 0 else 0
+        self._pending = text[cut:]
+        self.parse(text[:cut])
+
+    def close(self) -> None:
+        self.parse(self._pending)
+        self._pending = ''
+
+    def parse(self, text: str) -> None:
+        """Parses the rows and error paragraphs of text, that holds only complete ones"""
+        if self._data_row is None:
+            start = text.find(FAKE_TABLE_HEADER)
+            if start >= 0:
+                start += len(FAKE_TABLE_HEADER)
+                end = text.find('</div></div>', start) + 12
+                if end < 12 or '-row' in text[start:end]:
+                    # Spaced markup
+                    cells = FAKE_TABLE_ROW_CELLS.match(text, start)
+                    end = cells.end() if cells else start
+                self.headers, self._data_row = fake_table_layout(text[start:end])
+            elif FAKE_TABLE_DATA in text:
+                # No header: name/value pairs
+                self._data_row = fake_table_data_row(2)
+        if self._data_row is not None:
+            found = self._data_row.findall(text)
+            headers = self.headers
+            if headers is not None:
+                # Plain rows: zip stops before the last, empty, group
+                self.rows.extend([dict(zip(headers, fake_table_cells(cells[-1]) if cells[-1] else cells))
+                                  for cells in found])
+            else:
+                for cells in found:
+                    if not cells[-1]:
+                        self.fields[cells[0]] = cells[1]
+                    else:
+                        row = fake_table_cells(cells[-1])
+                        if len(row) == 2:
+                            self.fields[row[0]] = row[1]
+        if '<p class="error"' in text:
+            self.errors.extend(FAKE_TABLE_TAG.sub('', error) if '<' in error else error
+                               for error in FAKE_TABLE_ERROR.findall(text))
+
+
+def iter_fake_table(html: Union[str, Iterable[str]]) -> Iterator[dict]:
+    """Yields the rows of a client fake table as dicts, header -> value, as they are parsed.
+    html is the whole page or an iterable of text chunks. Error paragraphs come last, as {"error": ...}"""
+    parser = FakeTableParser()
+    if isinstance(html, str):
+        parser.parse(html)
+    else:
+        for chunk in html:
+            parser.feed(chunk)
+            while parser.rows:
+                yield parser.rows.popleft()
+        parser.close()
+    yield from parser.rows
+    for error in parser.errors:
+        yield {"error": error}
+
+
+def fake_table_to_list(html: str) -> list:
+    parser = FakeTableParser()
+    parser.parse(html)
+    return list(parser.rows) + [{"error": error} for error in parser.errors]
+
 
+FAKE_TABLE_NOTICE = re.compile(r'<p class="notice">([^<]*)</p>')
 
-def fake_table_frozen_to_dict(html: str):
+
+def fake_table_notices(html: str) -> list:
+    """Notice paragraphs of a client page, like "... may not be approved" on a forward"""
+    if '<p class="notice"' not in html:
+        return []
+    return [unescape(notice).strip() for notice in FAKE_TABLE_NOTICE.findall(html)]
+
+
+# Name -> value lookups anywhere in the page, for frozen edge layouts the table parsers don't get.
+FROZEN_FIELDS = {name: re.compile(f'<div>{re.escape(name)}</div>\\s*<div[^>]*>([^<]*)</div>')
+                 for name in ("height", "hash", "verification timestamp (ms)", "distance from open edge")}
+
+
+def fake_table_frozen_to_dict(html: str) -> dict:
     """Neither clean nor future proof, but that's the way client sends back the data"""
-    try:
-        height = re.search(r'<div>height</div><div>([^<]*)</div>', html).groups()[0]
-    except Exception:
-        height = 0
-    try:
-        hash = re.search(r'<div>hash</div><div[^>]*>([^<]*)</div>', html).groups()[0]
-    except Exception:
-        hash = b''
-    try:
-        timestamp = re.search(r'<div>verification timestamp \(ms\)</div><div>([^<]*)</div>', html).groups()[0]
-    except Exception:
-        timestamp = 0
-    try:
-        distance = re.search(r'<div>distance from open edge</div><div>([^<]*)</div>', html).groups()[0]
-    except Exception:
-        distance = 0
-    values = {"height": int(height), "hash": hash.replace('-', ''),
-              "timestamp": timestamp, "distance": distance}
+    parser = FakeTableParser()
+    parser.parse(html)
+    fields = parser.fields
+    for name, lookup in FROZEN_FIELDS.items():
+        if name not in fields:
+            # Some other markup: the name and value cells are still next to each other
+            found = lookup.search(html)
+            if found:
+                fields[name] = found.group(1)
+    values = {"height": int(fields.get("height", 0)), "hash": fields.get("hash", "").replace('-', ''),
+              "timestamp": fields.get("verification timestamp (ms)", 0),
+              "distance": fields.get("distance from open edge", 0)}
     return values
+
+
+def micronyzos(amount: Union[str, float, Decimal]) -> int:
+    """Exact amount in micro nyzos of a nyzo amount, given as text, Decimal or float.
+    Floats go through their shortest repr: 2.01 gives 2010000, where int(2.01 * 1e6) is 2009999."""
+    try:
+        value = Decimal(str(amount).strip()) * 1000000
+    except InvalidOperation:
+        raise ValueError(f"invalid amount '{amount}'")
+    if not value.is_finite() or value != value.to_integral_value():
+        raise ValueError(f"invalid amount '{amount}', at most 6 decimals")
+    return int(value)
+
+
+def read_payout_rows(lines: Iterable[str]) -> Iterator[dict]:
+    """Streams payout rows from CSV (recipient,amount[,data]) or JSONL ({"recipient":..., "amount":..., "data":...})
+    lines, one row per line. Empty lines, # comments and a CSV header line are skipped.
+    Yields dicts with the source line number, malformed lines come back with an "error" key.
+    Amounts are read as decimals: "micronyzos" is the exact amount to sign, "amount" the nyzos for display."""
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if line == '' or line.startswith('#'):
+            continue
+        row = {"line": line_number}
+        try:
+            if line.startswith('{'):
+                item = json.loads(line, parse_float=Decimal)
+                row["recipient"] = str(item["recipient"])
+                row["micronyzos"] = micronyzos(item["amount"])
+                row["amount"] = row["micronyzos"] / 1000000
+                row["data"] = str(item.get("data", ""))
+            else:
+                fields = next(csv.reader([line]))
+                if fields[0].strip().lower() == "recipient":
+                    # CSV header
+                    continue
+                row["recipient"] = fields[0].strip()
+                row["micronyzos"] = micronyzos(fields[1])
+                row["amount"] = row["micronyzos"] / 1000000
+                row["data"] = fields[2] if len(fields) > 2 else ""
+        except Exception as e:
+            row["error"] = f"Malformed line: {e}"
+        yield row
+
+
+def read_token_rows(lines: Iterable[str], default_token: str="") -> Iterator[dict]:
+    """Streams token transfer rows from CSV (recipient,amount[,token]) or JSONL ({"recipient":..., "amount":..., "token":...})
+    lines, same rules as read_payout_rows. Amounts are kept as plain decimal strings, token amounts can be large or precise.
+    Rows without a token get default_token."""
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if line == '' or line.startswith('#'):
+            continue
+        row = {"line": line_number}
+        try:
+            if line.startswith('{'):
+                item = json.loads(line)
+                recipient, amount, token = item["recipient"], item["amount"], item.get("token", "")
+            else:
+                fields = next(csv.reader([line]))
+                if fields[0].strip().lower() == "recipient":
+                    # CSV header
+                    continue
+                recipient, amount, token = fields[0], fields[1], fields[2] if len(fields) > 2 else ""
+            row["recipient"] = str(recipient).strip()
+            try:
+                row["amount"] = format(Decimal(str(amount).strip()), 'f')
+            except InvalidOperation:
+                raise ValueError(f"invalid amount '{amount}'")
+            row["token"] = str(token).strip() or default_token
+        except Exception as e:
+            row["error"] = f"Malformed line: {e}"
+        yield row
+
+
+def read_vote_rows(lines: Iterable[str]) -> Iterator[dict]:
+    """Streams the votes of a vote file, massvote sigs.txt format: one "sig_... [vote]" a line, vote 1 by default"""
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if line == '' or line.startswith('#'):
+            continue
+        row = {"line": line_number}
+        try:
+            parts = line.split()
+            if len(parts) > 2 or not parts[0].startswith("sig_"):
+                raise ValueError("Expected: sig_... [vote]")
+            row["sig"], row["vote"] = parts[0], int(parts[1]) if len(parts) > 1 else 1
+            if row["vote"] not in (0, 1):
+                raise ValueError("Vote has to be 0 or 1")
+        except Exception as e:
+            row["error"] = f"Malformed line: {e}"
+        yield row
+
+
+def read_tx_rows(lines: Iterable[str]) -> Iterator[dict]:
+    """Streams tx__ rows of a broadcast file: one tx__ a line, or JSON lines with a "tx__" key"""
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if line == '' or line.startswith('#'):
+            continue
+        row = {"line": line_number}
+        try:
+            row["tx__"] = json.loads(line)["tx__"] if line.startswith('{') else line
+            if not row["tx__"].startswith("tx__"):
+                raise ValueError("Not a tx__ string")
+        except Exception as e:
+            row["error"] = f"Malformed line: {e}"
+        yield row
+
+
+def read_last_jsonl(file_name: str) -> Union[dict, None]:
+    """Returns the last complete json line of a file, None if there is none.
+    An incomplete trailing line - from an interrupted write - is truncated away so appends can resume cleanly."""
+    if not path.isfile(file_name):
+        return None
+    with open(file_name, "rb+") as fp:
+        position = fp.seek(0, SEEK_END)
+        # Read backward by chunks until we hold the last full line
+        tail = b''
+        while position > 0 and tail.count(b'\n') < 2:
+            step = min(65536, position)
+            position -= step
+            fp.seek(position)
+            tail = fp.read(step) + tail
+        if not tail.endswith(b'\n'):
+            cut = tail.rfind(b'\n') + 1
+            fp.truncate(position + cut)
+            tail = tail[:cut]
+    lines = tail.splitlines()
+    if not lines:
+        return None
+    return json.loads(lines[-1])
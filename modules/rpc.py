@@ -0,0 +1,89 @@
+"""
+Local JSON RPC between Nyzocli and a resident "serve" process, over a Unix socket.
+
+One request per connection: the client sends a json line {"args": [...], "stdin": "...", "cwd": "..."}
+and reads back a json line {"exit_code": 0, "output": "...", "stderr": "..."}.
+Relative paths of the command resolve in "cwd", the directory of the caller.
+
+Only uses the standard library, so that forwarding a command stays cheap.
+"""
+
+import json
+import socket
+import sys
+from os import getcwd, path
+from typing import Union
+
+
+DEFAULT_SOCKET_FILE = 'nyzocli.sock'
+# Env var telling Nyzocli to forward commands to that socket
+SOCKET_ENV = 'NYZOCLI_SOCKET'
+# Commands that always run locally: they would hold the single threaded serve process until stopped
+LOCAL_COMMANDS = ('serve', 'follow', 'watch-balance')
+
+
+def local_command(args: list) -> Union[str, None]:
+    """The command of args that can not be forwarded, if any"""
+    for command in LOCAL_COMMANDS:
+        if command in args:
+            return command
+    return None
+
+
+def default_socket_path(private_dir: str) -> str:
+    return path.join(private_dir, DEFAULT_SOCKET_FILE)
+
+
+def read_message(sock: socket.socket) -> dict:
+    """Reads a json line from the socket"""
+    chunks = []
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        if chunk.endswith(b'\n'):
+            break
+    return json.loads(b''.join(chunks).decode('utf-8'))
+
+
+def write_message(sock: socket.socket, message: dict) -> None:
+    sock.sendall(json.dumps(message).encode('utf-8') + b'\n')
+
+
+def rpc_call(socket_path: str, args: list, stdin: str=None, timeout: float=None, cwd: str=None) -> Union[dict, None]:
+    """Runs a command on the serve process. Returns its answer, or None if there is no serve process listening."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        return None
+    try:
+        sock.settimeout(timeout)
+        request = {"args": args}
+        if stdin is not None:
+            request["stdin"] = stdin
+        if cwd is not None:
+            request["cwd"] = cwd
+        write_message(sock, request)
+        return read_message(sock)
+    finally:
+        sock.close()
+
+
+def forward_command(socket_path: str, args: list) -> Union[int, None]:
+    """Thin client: runs the command line on the serve process listening on socket_path and relays its output.
+    Returns the exit code, or None if the command has to run locally."""
+    if not path.exists(socket_path) or local_command(args):
+        return None
+    stdin = sys.stdin.read() if '-' in args and not sys.stdin.isatty() else None
+    answer = rpc_call(socket_path, args, stdin, cwd=getcwd())
+    if answer is None:
+        return None
+    sys.stdout.write(answer.get("output", ""))
+    # Logs, timings and summaries of the command
+    sys.stderr.write(answer.get("stderr", ""))
+    if answer.get("error"):
+        sys.stderr.write(f"Error: {answer['error']}\n")
+    return answer.get("exit_code", 0)
@@ -0,0 +1,188 @@
+"""
+Local signing helpers, shared by Nyzocli and the utils scripts.
+
+Key pairs are derived once per seed and process, and only kept in memory.
+SigningEngine signs big batches across a process pool.
+
+Pulls pynyzo and nyzostrings in, so Nyzocli only imports it from the commands that sign.
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from os import cpu_count
+from typing import Iterable, Iterator, List, Tuple, Union
+
+from nyzostrings.nyzostringencoder import NyzoStringEncoder
+from nyzostrings.nyzostringtransaction import NyzoStringTransaction
+from pynyzo.keyutil import KeyUtil
+from pynyzo.transaction import Transaction
+
+
+@lru_cache(maxsize=1024)
+def get_keys(seed: bytes) -> Tuple[object, str]:
+    """Private seed -> (signing key, public address as hex), derived once per process."""
+    key, public = KeyUtil.get_from_private_seed(seed.hex())
+    return key, public.to_bytes().hex()
+
+
+def derive_keys(key_: str) -> Tuple[object, str]:
+    """key_ nyzostring -> (signing key, public address as hex). Derive once, sign many."""
+    return get_keys(NyzoStringEncoder.decode(key_).get_bytes())
+
+
+def vote_timestamp(now: float) -> int:
+    """Vote tx timestamp in ms: fixed 10 sec delay for inclusion"""
+    return int(now * 10) * 100 + 10000
+
+
+def vote_transaction(address: str, cycle_tx_sig: str, vote: int, timestamp: int) -> Transaction:
+    """Unsigned cycle tx vote, sign vote_payload(transaction)"""
+    cycle_tx_sig_bytes = NyzoStringEncoder.decode(cycle_tx_sig).get_bytes()
+    return Transaction.from_vote_data(timestamp, bytes.fromhex(address), vote, cycle_tx_sig_bytes)
+
+
+def vote_payload(transaction: Transaction) -> bytes:
+    """The bytes a vote signature covers"""
+    return transaction.get_bytes(for_signing=True)[:106]
+
+
+def encode_vote(address: str, cycle_tx_sig: str, vote: int, timestamp: int, signature: bytes) -> str:
+    """Signed cycle tx vote as a tx__ nyzostring"""
+    cycle_tx_sig_bytes = NyzoStringEncoder.decode(cycle_tx_sig).get_bytes()
+    tx = NyzoStringTransaction.from_hex_vote(hex(timestamp), address, signature.hex(), vote, cycle_tx_sig_bytes.hex())
+    return NyzoStringEncoder.encode(tx)
+
+
+def sign_vote(key, address: str, cycle_tx_sig: str, vote: int, timestamp: int) -> Tuple[Transaction, str]:
+    """Signs a cycle tx vote. Returns the transaction and its tx__ nyzostring."""
+    transaction = vote_transaction(address, cycle_tx_sig, vote, timestamp)
+    sign = KeyUtil.sign_bytes(vote_payload(transaction), key)
+    return transaction, encode_vote(address, cycle_tx_sig, vote, timestamp, sign)
+
+
+def standard_transaction(address: str, recipient_raw: str, amount: int, data: str, frozen: dict,
+                         timestamp: int) -> Transaction:
+    """Unsigned standard transaction of amount micro nyzos, sign its get_bytes(for_signing=True)"""
+    return Transaction(buffer=None, type=Transaction.type_standard, timestamp=timestamp,
+                       sender_identifier=bytes.fromhex(address), amount=amount,
+                       receiver_identifier=bytes.fromhex(recipient_raw),
+                       previous_block_hash=bytes.fromhex(frozen["hash"]),
+                       previous_hash_height=frozen['height'],
+                       signature=b'', sender_data=data[:32].encode("utf-8"))
+
+
+def encode_standard(address: str, recipient_raw: str, amount: int, data: str, frozen: dict, timestamp: int,
+                    signature: bytes) -> str:
+    """Signed standard transaction of amount micro nyzos as a tx__ nyzostring"""
+    tx = NyzoStringTransaction(Transaction.type_standard, timestamp, amount, bytes.fromhex(recipient_raw),
+                               frozen['height'],
+                               bytes.fromhex(frozen["hash"]),
+                               bytes.fromhex(address), data[:32].encode("utf-8"),
+                               signature)
+    return NyzoStringEncoder.encode(tx)
+
+
+def transaction_signature(tx__: str) -> bytes:
+    """Signature of a standard transaction tx__ nyzostring, its last 64 bytes"""
+    return NyzoStringEncoder.decode(tx__).get_bytes()[-64:]
+
+
+def transaction_timestamp(tx__: str) -> int:
+    """Timestamp in ms of a tx__ nyzostring, standard or vote: the 8 bytes after the type"""
+    return int.from_bytes(NyzoStringEncoder.decode(tx__).get_bytes()[1:9], "big")
+
+
+# Signing keys of a pool process, by seed index. Set once by the pool initializer.
+_WORKER_KEYS = []
+
+
+def _init_worker(seeds: List[bytes]) -> None:
+    _WORKER_KEYS[:] = [get_keys(seed)[0] for seed in seeds]
+
+
+def _sign_chunk(items: List[Tuple[int, bytes]], keys: list=None) -> List[Tuple[Union[bytes, None], Union[str, None]]]:
+    keys = _WORKER_KEYS if keys is None else keys
+    results = []
+    for index, payload in items:
+        if payload is None:
+            results.append((None, None))
+            continue
+        try:
+            results.append((keys[index].sign(payload), None))
+        except Exception as e:
+            results.append((None, f"{e.__class__.__name__}: {e}"))
+    return results
+
+
+class SigningEngine:
+    """Signs (seed index, payload) items with a fixed list of seeds - payloads being
+    Transaction.get_bytes(for_signing=True) or vote bytes - across a pool of processes.
+    Every process derives each key pair once. Results come in the items order, as (signature, None),
+    or (None, error) for an item that could not be signed. A None payload passes through as (None, None).
+    Small batches are signed in this process, a pool only pays off for big ones."""
+
+    def __init__(self, seeds: List[bytes], workers: int=None, chunk_size: int=500, min_parallel: int=2000):
+        self.seeds = list(seeds)
+        self.workers = workers or cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.min_parallel = min_parallel
+        self._keys = None
+        self._pool = None
+
+    def _local_keys(self) -> list:
+        if self._keys is None:
+            self._keys = [get_keys(seed)[0] for seed in self.seeds]
+        return self._keys
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                             initargs=(self.seeds, ))
+        return self._pool
+
+    def start(self) -> None:
+        """Starts the pool processes now. They are forked: better before the caller starts any thread."""
+        if self.workers >= 2:
+            self._get_pool().submit(int).result()
+
+    def sign(self, items: List[Tuple[int, bytes]]) -> List[Tuple[Union[bytes, None], Union[str, None]]]:
+        """Signs a batch, all results at once"""
+        if self.workers < 2 or len(items) < self.min_parallel:
+            return _sign_chunk(items, self._local_keys())
+        return list(self.sign_stream(items))
+
+    def sign_stream(self, items: Iterable[Tuple[int, bytes]]) -> Iterator[Tuple[Union[bytes, None], Union[str, None]]]:
+        """Signs items from any iterable, yielding results in order.
+        At most 2 chunks per process are in flight, memory stays flat whatever the input size."""
+        items = iter(items)
+        if self.workers < 2:
+            keys = self._local_keys()
+            while True:
+                chunk = list(islice(items, self.chunk_size))
+                if not chunk:
+                    return
+                yield from _sign_chunk(chunk, keys)
+        pool = self._get_pool()
+        pending = deque()
+        while True:
+            while len(pending) < 2 * self.workers:
+                chunk = list(islice(items, self.chunk_size))
+                if not chunk:
+                    break
+                pending.append(pool.submit(_sign_chunk, chunk))
+            if not pending:
+                return
+            yield from pending.popleft().result()
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
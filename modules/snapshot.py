@@ -0,0 +1,73 @@
+"""
+Compact on-disk snapshot of a balance list.
+
+Header: magic (8 bytes), block height (8), number of records (4).
+Then fixed width records sorted by identifier:
+identifier (32 bytes), balance in micro nyzos (8), blocks until fee (2), all big endian.
+
+Lookups bisect the memory mapped file, without decoding the whole list.
+"""
+
+import struct
+from os import path
+from typing import Tuple, Union
+
+from modules.helpers import atomic_write, get_private_dir
+
+
+SNAPSHOT_MAGIC = b'NYZOBL01'
+SNAPSHOT_HEADER = struct.Struct(">8sQI")
+SNAPSHOT_RECORD = struct.Struct(">32sQH")
+
+DEFAULT_SNAPSHOT_FILE = 'balance_snapshot.bin'
+
+
+def default_snapshot_path() -> str:
+    return path.join(get_private_dir(), DEFAULT_SNAPSHOT_FILE)
+
+
+def write_snapshot(file_name: str, height: int, items: list) -> int:
+    """Saves BalanceListItems as a snapshot file, atomically. Returns the number of records."""
+    records = sorted((bytes(item.get_identifier()), item.get_balance(), item.get_blocks_until_fee())
+                     for item in items)
+    with atomic_write(file_name, "wb") as fp:
+        fp.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, height, len(records)))
+        for record in records:
+            fp.write(SNAPSHOT_RECORD.pack(*record))
+    return len(records)
+
+
+class BalanceSnapshot:
+    """Read only, memory mapped view of a snapshot file"""
+
+    def __init__(self, file_name: str):
+        # Imported by the commands that read a snapshot only, not at Nyzocli startup
+        import mmap
+        self._fp = open(file_name, "rb")
+        self._map = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.height, self.count = SNAPSHOT_HEADER.unpack_from(self._map, 0)
+        if magic != SNAPSHOT_MAGIC:
+            self.close()
+            raise ValueError(f"{file_name} is not a balance snapshot")
+
+    def find(self, identifier: bytes) -> Union[Tuple[int, int], None]:
+        """Returns (balance, blocks_until_fee) of an identifier, None if not in the snapshot"""
+        low, high = 0, self.count
+        size = SNAPSHOT_RECORD.size
+        start = SNAPSHOT_HEADER.size
+        while low < high:
+            middle = (low + high) // 2
+            offset = start + middle * size
+            if self._map[offset:offset + 32] < identifier:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count:
+            found, balance, blocks_until_fee = SNAPSHOT_RECORD.unpack_from(self._map, start + low * size)
+            if found == identifier:
+                return balance, blocks_until_fee
+        return None
+
+    def close(self) -> None:
+        self._map.close()
+        self._fp.close()
@@ -0,0 +1,92 @@
+"""
+Wall time per phase of a command, for --timings.
+
+Phases add up when they happen several times - or in several threads - with a count and the max.
+Reports go to stderr, to a JSONL log, or to a Prometheus textfile (node_exporter textfile collector).
+"""
+
+import json
+import threading
+from contextlib import contextmanager
+from os import path
+from time import perf_counter, time
+
+from modules.helpers import atomic_write
+
+
+class Timings:
+    """Thread safe phase timer"""
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, perf_counter() - start)
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            count, total, longest = self.phases.get(name, (0, 0.0, 0.0))
+            self.phases[name] = (count + 1, total + seconds, max(longest, seconds))
+
+    def report(self) -> dict:
+        with self._lock:
+            phases = {name: {"count": count, "total": round(total, 6), "max": round(longest, 6)}
+                      for name, (count, total, longest) in self.phases.items()}
+        return {"total": round(perf_counter() - self.started, 6), "phases": phases}
+
+    def to_text(self) -> str:
+        report = self.report()
+        lines = [f"Total {report['total']:0.3f} sec"]
+        for name, phase in sorted(report["phases"].items(), key=lambda item: -item[1]["total"]):
+            lines.append(f"  {name:<24} {phase['total']:0.3f} sec  x{phase['count']}  max {phase['max']:0.3f}")
+        return "\n".join(lines)
+
+
+def append_jsonl(file_name: str, record: dict) -> None:
+    """One json line per command run"""
+    with open(file_name, "a") as fp:
+        fp.write(json.dumps(record) + "\n")
+
+
+def prometheus_lines(command: str, report: dict) -> list:
+    label = f'command="{command}"'
+    lines = [f'nyzocli_command_seconds{{{label}}} {report["total"]}',
+             f'nyzocli_command_last_run_timestamp_seconds{{{label}}} {int(time())}']
+    for name, phase in sorted(report["phases"].items()):
+        labels = f'{label},phase="{name}"'
+        lines.append(f'nyzocli_phase_seconds{{{labels}}} {phase["total"]}')
+        lines.append(f'nyzocli_phase_count{{{labels}}} {phase["count"]}')
+        lines.append(f'nyzocli_phase_max_seconds{{{labels}}} {phase["max"]}')
+    return lines
+
+
+PROMETHEUS_HEADER = ["# HELP nyzocli_command_seconds Wall time of the last run of a command",
+                     "# TYPE nyzocli_command_seconds gauge",
+                     "# HELP nyzocli_command_last_run_timestamp_seconds When the command last ran",
+                     "# TYPE nyzocli_command_last_run_timestamp_seconds gauge",
+                     "# HELP nyzocli_phase_seconds Wall time spent in a phase during the last run of a command",
+                     "# TYPE nyzocli_phase_seconds gauge",
+                     "# HELP nyzocli_phase_count Times a phase ran during the last run of a command",
+                     "# TYPE nyzocli_phase_count gauge",
+                     "# HELP nyzocli_phase_max_seconds Longest single run of a phase during the last run of a command",
+                     "# TYPE nyzocli_phase_max_seconds gauge"]
+
+
+def write_prometheus(file_name: str, command: str, report: dict) -> None:
+    """Updates the metrics of that command in a Prometheus textfile, keeps the other commands' ones.
+    Atomic rename, so the collector never reads a partial file. World readable, as the collector
+    usually runs as another user."""
+    kept = []
+    if path.isfile(file_name):
+        with open(file_name) as fp:
+            kept = [line.rstrip("\n") for line in fp
+                    if line.startswith("nyzocli_") and f'command="{command}"' not in line]
+    with atomic_write(file_name, permissions=0o644) as fp:
+        fp.write("\n".join(PROMETHEUS_HEADER + kept + prometheus_lines(command, report)) + "\n")
@@ -0,0 +1,97 @@
+"""
+Local SQLite mirror of token balances and fees, filled by `token sync`.
+
+One database per tokens API url in the user private dir.
+Each tracked address keeps the time it was last synced, later syncs only ask for the stale ones.
+Balances of an address are replaced as a whole, in one transaction, so readers never see half an update.
+"""
+
+import json
+from hashlib import sha1
+from os import path
+from time import time
+from typing import Iterable, Tuple, Union
+
+from modules.helpers import get_private_dir
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS addresses (address TEXT PRIMARY KEY, synced_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS balances (address TEXT NOT NULL, token TEXT NOT NULL, amount TEXT NOT NULL,
+                                     decimals INTEGER, PRIMARY KEY (address, token));
+CREATE TABLE IF NOT EXISTS fees (api TEXT PRIMARY KEY, fees TEXT NOT NULL, synced_at REAL NOT NULL);
+"""
+
+
+def default_mirror_path(api: str) -> str:
+    """Mirror file for a given tokens API url"""
+    digest = sha1(api.encode('utf-8')).hexdigest()[:16]
+    return path.join(get_private_dir(), f"tokens_{digest}.sqlite")
+
+
+class TokenMirror:
+
+    def __init__(self, file_name: str):
+        # Imported by the commands that open a mirror only, not at Nyzocli startup
+        import sqlite3
+        self.file_name = file_name
+        self.db = sqlite3.connect(file_name)
+        # Readers (token balance) do not wait for a running sync
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def track(self, addresses: Iterable[str]) -> None:
+        """Adds addresses to the mirror, as never synced"""
+        with self.db:
+            self.db.executemany("INSERT OR IGNORE INTO addresses (address, synced_at) VALUES (?, 0)",
+                                ((address, ) for address in addresses))
+
+    def tracked(self) -> list:
+        return [row[0] for row in self.db.execute("SELECT address FROM addresses ORDER BY address")]
+
+    def stale(self, max_age: float) -> list:
+        """Tracked addresses last synced more than max_age seconds ago"""
+        return [row[0] for row in self.db.execute("SELECT address FROM addresses WHERE synced_at < ? ORDER BY address",
+                                                  (time() - max_age, ))]
+
+    def update(self, address: str, balances: dict, synced_at: float=None) -> None:
+        """Replaces the balances of an address by the tokens API answer {token: {"amount": ..., "decimals": ...}}"""
+        with self.db:
+            self.db.execute("DELETE FROM balances WHERE address = ?", (address, ))
+            self.db.executemany("INSERT INTO balances (address, token, amount, decimals) VALUES (?, ?, ?, ?)",
+                                ((address, token, str(value["amount"]), value.get("decimals"))
+                                 for token, value in balances.items()))
+            self.db.execute("INSERT OR REPLACE INTO addresses (address, synced_at) VALUES (?, ?)",
+                            (address, time() if synced_at is None else synced_at))
+
+    def balances(self, address: str) -> Union[Tuple[dict, float], None]:
+        """Mirrored balances of an address, same shape as the tokens API, and when they were synced.
+        None if the address was never synced."""
+        row = self.db.execute("SELECT synced_at FROM addresses WHERE address = ?", (address, )).fetchone()
+        if row is None or not row[0]:
+            return None
+        balances = {token: {"amount": amount, "decimals": decimals}
+                    for token, amount, decimals in self.db.execute(
+                        "SELECT token, amount, decimals FROM balances WHERE address = ? ORDER BY token", (address, ))}
+        return balances, row[0]
+
+    def set_fees(self, api: str, fees: dict) -> None:
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO fees (api, fees, synced_at) VALUES (?, ?, ?)",
+                            (api, json.dumps(fees), time()))
+
+    def fees(self, api: str, max_age: float) -> Union[dict, None]:
+        """Mirrored fees if synced less than max_age seconds ago"""
+        row = self.db.execute("SELECT fees, synced_at FROM fees WHERE api = ?", (api, )).fetchone()
+        if row is None or time() - row[1] > max_age:
+            return None
+        return json.loads(row[0])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
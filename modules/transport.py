@@ -0,0 +1,44 @@
+"""
+Shared HTTP transport for the nyzo client and token API calls.
+
+One keep-alive session per process, pooled per host, with default timeouts
+and retries with backoff on connection errors and transient server errors.
+"""
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# Server statuses worth a retry
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class HttpTransport:
+    """Pooled keep-alive requests session, with timeout and retry defaults"""
+
+    def __init__(self, timeout: float=30, retries: int=3, backoff: float=0.5, pool_size: int=32):
+        self.timeout = timeout
+        self.retries = retries
+        self.session = Session()
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUSES,
+                      allowed_methods=frozenset(["GET"]), raise_on_status=False)
+        # pool_maxsize is the number of kept-alive connections per host, it has to cover the concurrent workers.
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, url: str, **kwargs):
+        """Same as requests.get, through the shared session"""
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def close(self) -> None:
+        self.session.close()
+
+
+def bind_nyzo_client(transport: HttpTransport) -> None:
+    """Routes pynyzo NyzoClient calls through the transport.
+    NyzoClient uses a module level requests.get, so that's the one to swap."""
+    import pynyzo.clienthelpers as clienthelpers
+    clienthelpers.get = transport.get
@@ -0,0 +1,167 @@
+"""
+Raw exchanges with verifiers, with a deadline per exchange, and a pool of connections by host.
+
+pynyzo Connection has no connect timeout and a fixed 45 sec read timeout,
+too long when sweeping many verifiers. Same 4 bytes length framing.
+
+Only uses the standard library, message encoding and decoding stays with pynyzo.
+"""
+
+import select
+import socket
+import struct
+import threading
+from contextlib import nullcontext
+from time import monotonic
+from typing import Tuple
+
+
+DEFAULT_VERIFIER_PORT = 9444
+DEFAULT_VERIFIER_TIMEOUT = 45.0  # seconds, same as pynyzo Connection
+
+
+def parse_host(host: str, default_port: int=DEFAULT_VERIFIER_PORT) -> Tuple[str, int]:
+    """"ip", "ip:port" or "[ipv6]:port" -> (ip, port)"""
+    host = host.strip()
+    if host.startswith('['):
+        ip, _, port = host[1:].partition(']')
+        port = port.lstrip(':')
+    elif host.count(':') == 1:
+        ip, port = host.split(':')
+    else:
+        ip, port = host, ''
+    return ip, int(port) if port else default_port
+
+
+def read_hosts(lines) -> list:
+    """Host list from text lines, one host a line. Empty lines and # comments are skipped."""
+    hosts = []
+    for line in lines:
+        line = line.split('#', 1)[0].strip()
+        if line:
+            hosts.append(line)
+    return hosts
+
+
+def _recv_exact(sock: socket.socket, length: int, deadline: float) -> bytes:
+    chunks = []
+    while length > 0:
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            raise socket.timeout("timed out")
+        sock.settimeout(remaining)
+        chunk = sock.recv(min(length, 65536))
+        if not chunk:
+            raise ConnectionError("Socket EOF")
+        chunks.append(chunk)
+        length -= len(chunk)
+    return b''.join(chunks)
+
+
+def _exchange_on(sock: socket.socket, data: bytes, deadline: float) -> bytes:
+    sock.settimeout(max(deadline - monotonic(), 0.001))
+    sock.sendall(struct.pack(">I", len(data) + 4) + data)
+    length = struct.unpack(">I", _recv_exact(sock, 4, deadline))[0] - 4
+    return _recv_exact(sock, length, deadline)
+
+
+def _is_idle_alive(sock: socket.socket) -> bool:
+    """True if an idle connection can take a new message: nothing to read, not even an EOF"""
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+    except (OSError, ValueError):
+        return False
+    # Readable while idle means closed by the peer, or unexpected data: either way, not reusable
+    return not readable
+
+
+class VerifierPool:
+    """Connections to verifiers by host, shared by all verifier requests of a process, thread safe.
+
+    The connection opened by connect() to check a verifier is the one its first message goes through.
+    After an answer, a connection goes back to the pool if the verifier keeps it open. Nyzo verifiers close it
+    after each answer: it is seen closed and dropped, the next message opens one.
+    A pooled connection found dead on use is replaced transparently, once."""
+
+    def __init__(self, timeout: float=DEFAULT_VERIFIER_TIMEOUT, max_idle: int=4, timer=None):
+        self.timeout = timeout
+        self.max_idle = max_idle
+        # phase name -> context manager, times the connects (see Nyzocli --timings)
+        self.timer = timer
+        self.stats = {"connects": 0, "reused": 0, "dropped": 0}
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _connect(self, address: Tuple[str, int], deadline: float) -> socket.socket:
+        with self.timer("connect") if self.timer else nullcontext():
+            sock = socket.create_connection(address, timeout=max(deadline - monotonic(), 0.001))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self._lock:
+            self.stats["connects"] += 1
+        return sock
+
+    def _acquire(self, address: Tuple[str, int]):
+        """A live idle connection to that address, or None"""
+        while True:
+            with self._lock:
+                idle = self._idle.get(address)
+                if not idle:
+                    return None
+                sock = idle.pop()
+            if _is_idle_alive(sock):
+                with self._lock:
+                    self.stats["reused"] += 1
+                return sock
+            sock.close()
+
+    def _release(self, address: Tuple[str, int], sock: socket.socket) -> None:
+        if _is_idle_alive(sock):
+            with self._lock:
+                idle = self._idle.setdefault(address, [])
+                if len(idle) < self.max_idle:
+                    idle.append(sock)
+                    return
+        sock.close()
+
+    def connect(self, host: str) -> None:
+        """Makes sure there is an open connection to host, raises if the verifier can not be reached.
+        The connection stays in the pool for the next message to that host, so checking costs no extra connect."""
+        address = parse_host(host)
+        sock = self._acquire(address)
+        if sock is None:
+            sock = self._connect(address, monotonic() + self.timeout)
+        self._release(address, sock)
+
+    def exchange(self, host: str, data: bytes, timeout: float=None) -> bytes:
+        """Sends one message buffer (as from Message.get_bytes_for_transmission) to host, returns the answer buffer.
+        The whole exchange, connect included, has to fit in timeout seconds (default: the pool one)."""
+        address = parse_host(host)
+        deadline = monotonic() + (self.timeout if timeout is None else timeout)
+        sock = self._acquire(address)
+        reused = sock is not None
+        if not reused:
+            sock = self._connect(address, deadline)
+        try:
+            answer = _exchange_on(sock, data, deadline)
+        except OSError:
+            sock.close()
+            if not reused:
+                raise
+            # Closed by the verifier while we were not looking, a fresh connection then.
+            with self._lock:
+                self.stats["dropped"] += 1
+            sock = self._connect(address, deadline)
+            try:
+                answer = _exchange_on(sock, data, deadline)
+            except OSError:
+                sock.close()
+                raise
+        self._release(address, sock)
+        return answer
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for sockets in idle.values():
+            for sock in sockets:
+                sock.close()
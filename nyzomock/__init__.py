@@ -0,0 +1,12 @@
+"""
+Local stand-in Nyzo web client, tokens API and verifier, for offline and load testing of Nyzocli.
+
+python3 -m nyzomock --help
+"""
+
+from nyzomock.chain import MockChain
+from nyzomock.client import make_client_server
+from nyzomock.faults import Faults
+from nyzomock.verifier import make_verifier_server
+
+__all__ = ["MockChain", "Faults", "make_client_server", "make_verifier_server"]
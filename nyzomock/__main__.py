@@ -0,0 +1,57 @@
+"""
+Runs the mock client (with the tokens API) and the mock verifier until interrupted.
+
+python3 -m nyzomock
+python3 -m nyzomock --latency 0.05 --jitter 0.1 --failure_rate 0.02 --accounts 100000
+then
+./Nyzocli.py -c http://127.0.0.1:8765 -t http://127.0.0.1:8765/api -i 127.0.0.1 ...
+"""
+
+import argparse
+import threading
+
+from nyzomock.chain import MockChain
+from nyzomock.client import make_client_server
+from nyzomock.faults import Faults
+from nyzomock.verifier import make_verifier_server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python3 -m nyzomock", description="Mock Nyzo client and verifier")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--client_port", type=int, default=8765, help="Client and tokens API http port, 0 to disable")
+    parser.add_argument("--verifier_port", type=int, default=9444, help="Verifier port, 0 to disable")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every answer")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random extra seconds, up to that, added to every answer")
+    parser.add_argument("--failure_rate", type=float, default=0.0,
+                        help="Share of requests that fail: 503 or dropped connection for http, no answer for the verifier")
+    parser.add_argument("--start_height", type=int, default=5000000, help="Frozen edge at startup")
+    parser.add_argument("--block_time", type=float, default=7.0, help="Seconds between frozen blocks")
+    parser.add_argument("--accounts", type=int, default=1000, help="Balance list size")
+    parser.add_argument("--tx_per_block", type=int, default=2, help="Synthetic transactions in every block")
+    parser.add_argument("--max_blocks", type=int, default=10, help="Max blocks in a verifier answer")
+    parser.add_argument("--nickname", default="mock", help="Verifier nickname, in status")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Log http requests")
+    options = parser.parse_args()
+
+    chain = MockChain(start_height=options.start_height, block_time=options.block_time, accounts=options.accounts,
+                      tx_per_block=options.tx_per_block)
+    faults = Faults(latency=options.latency, jitter=options.jitter, failure_rate=options.failure_rate)
+    servers = []
+    if options.client_port:
+        servers.append(make_client_server(chain, faults, options.host, options.client_port, options.verbose))
+        print(f"Mock client on http://{options.host}:{options.client_port}, "
+              f"tokens API on http://{options.host}:{options.client_port}/api")
+    if options.verifier_port:
+        servers.append(make_verifier_server(chain, faults, options.host, options.verifier_port, options.nickname,
+                                            options.max_blocks))
+        print(f"Mock verifier on {options.host}:{options.verifier_port}")
+    threads = [threading.Thread(target=server.serve_forever, daemon=True) for server in servers]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
@@ -0,0 +1,100 @@
+"""
+Synthetic, deterministic chain shared by the mock client and verifier.
+
+The frozen edge advances one block every block_time seconds from start_height.
+Accounts are identifiers 0 to accounts - 1 (as 32 bytes big endian ints), account i holds i * 1000 + 1000000 micro nyzos.
+Every block holds tx_per_block standard transactions between accounts, the same ones for a given height.
+
+Encodings follow the nyzo wire format, as decoded by pynyzo: version 0 blocks and balance lists.
+"""
+
+import struct
+import threading
+from hashlib import sha256
+from random import Random
+from time import time
+
+
+class MockChain:
+
+    def __init__(self, start_height: int=5000000, block_time: float=7.0, accounts: int=1000, tx_per_block: int=2):
+        self.start_height = start_height
+        self.block_time = block_time
+        self.accounts = accounts
+        self.tx_per_block = tx_per_block
+        self.started = time()
+        # tx__ forwarded through the mock client -> planned block height
+        self.forwarded = {}
+        self.lock = threading.Lock()
+
+    def frozen_height(self) -> int:
+        return self.start_height + int((time() - self.started) / self.block_time)
+
+    def block_timestamp(self, height: int) -> int:
+        """Start timestamp of a block, ms"""
+        return int((self.started + (height - self.start_height) * self.block_time) * 1000)
+
+    @staticmethod
+    def block_hash(height: int) -> bytes:
+        return sha256(b"nyzomock" + struct.pack(">Q", height)).digest()
+
+    @staticmethod
+    def identifier(account: int) -> bytes:
+        return account.to_bytes(32, 'big')
+
+    def balance(self, identifier: bytes) -> int:
+        """Balance of an identifier, micro nyzos. 0 for unknown ones."""
+        account = int.from_bytes(identifier, 'big')
+        return account * 1000 + 1000000 if account < self.accounts else 0
+
+    def transactions(self, height: int) -> list:
+        """Serialized standard transactions of a block"""
+        rng = Random(height)
+        result = []
+        for i in range(self.tx_per_block):
+            sender = self.identifier(rng.randrange(self.accounts))
+            receiver = self.identifier(rng.randrange(self.accounts))
+            data = f"mock {height}-{i}".encode('utf-8')
+            result.append(struct.pack(">BQQ", 2, self.block_timestamp(height) + 1000 + i, rng.randrange(1, 10 ** 8))
+                          + receiver + struct.pack(">Q", height - 1) + sender
+                          + struct.pack(">B", len(data)) + data + rng.getrandbits(512).to_bytes(64, 'big'))
+        return result
+
+    def block_bytes(self, height: int) -> bytes:
+        transactions = self.transactions(height)
+        return (struct.pack(">Q", height) + self.block_hash(height - 1)
+                + struct.pack(">QQI", self.block_timestamp(height), self.block_timestamp(height) + 7000,
+                              len(transactions))
+                + b''.join(transactions)
+                + sha256(b"balance list" + struct.pack(">Q", height)).digest()
+                + b'\x44' * 32 + b'\x55' * 64)
+
+    def balance_list_bytes(self, height: int) -> bytes:
+        parts = [struct.pack(">QB", height, 0)]
+        previous_verifiers = min(height, 9)
+        parts.extend(b'\x66' * 32 for _ in range(previous_verifiers))
+        parts.append(struct.pack(">I", self.accounts))
+        for account in range(self.accounts):
+            parts.append(self.identifier(account) + struct.pack(">QH", account * 1000 + 1000000, 100))
+        return b''.join(parts)
+
+    def status_lines(self, nickname: str) -> list:
+        frozen = self.frozen_height()
+        return [f"nickname: {nickname}", "version: 600", "ID: 4444...4444",
+                "mesh: 2000 total, 1000 in cycle", "cycle length: 1000", "transactions: 0",
+                f"retention edge: {frozen - 20}", f"trailing edge: {frozen - 10}",
+                f"frozen edge: {frozen} ({nickname})", f"open edge: {frozen + 3}",
+                "blocks transmitted/created: 0/0", "votes requested: 0"]
+
+    def forward(self, tx__: str) -> int:
+        """Records a forwarded tx, returns its planned block height"""
+        height = self.frozen_height() + 3
+        with self.lock:
+            self.forwarded[tx__] = height
+        return height
+
+    def search(self, tx__: str) -> int:
+        """Height a forwarded tx was included at, 0 if not (yet) in the chain"""
+        with self.lock:
+            height = self.forwarded.get(tx__, 0)
+        return height if height and height <= self.frozen_height() else 0
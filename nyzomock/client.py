@@ -0,0 +1,140 @@
+"""
+Mock Nyzo web client and tokens API.
+
+Client pages come in the same "fake table" html shape as client.nyzo.co:
+/frozenEdge, /balance, /forwardTransaction and /transactionSearch.
+Tokens API json, with or without the /api prefix: /fees, /check_tx/..., /balances/{address}.
+"""
+
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from random import random
+from re import sub
+from urllib.parse import parse_qs, urlparse
+
+from nyzomock.chain import MockChain
+from nyzomock.faults import Faults
+
+
+TOKEN_NAME = "MOCK"
+
+
+def fake_table(headers: list, rows: list) -> str:
+    parts = ['<html><body><div class="fake-table"><div class="header-row">']
+    parts.extend(f'<div>{header}</div>' for header in headers)
+    parts.append('</div>')
+    for row in rows:
+        parts.append('<div class="data-row">' + ''.join(f'<div>{value}</div>' for value in row) + '</div>')
+    parts.append('</div></div></body></html>')
+    return ''.join(parts)
+
+
+def frozen_page(height: int, block_hash: bytes, timestamp: int) -> str:
+    hash_hex = block_hash.hex()
+    dashed = '-'.join(hash_hex[i:i + 16] for i in range(0, 64, 16))
+    return ('<html><body><div class="fake-table">'
+            f'<div class="data-row"><div>height</div><div>{height}</div></div>'
+            f'<div class="data-row"><div>hash</div><div class="extra-wrap">{dashed}</div></div>'
+            f'<div class="data-row"><div>verification timestamp (ms)</div><div>{timestamp}</div></div>'
+            '<div class="data-row"><div>distance from open edge</div><div>2</div></div>'
+            '</div></div></body></html>')
+
+
+def error_page(message: str) -> str:
+    return f'<html><body><p class="error">{message}</p></body></html>'
+
+
+def raw_identifier(address: str) -> bytes:
+    """Hex address (dashes allowed) -> raw identifier, empty if malformed"""
+    address = sub(r"[^0-9a-f]", "", address.lower())
+    return bytes.fromhex(address) if len(address) == 64 else b''
+
+
+class MockClientHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Set on the server class by make_client_server
+    chain = None
+    faults = None
+    verbose = False
+
+    def do_GET(self):
+        self.faults.delay()
+        if self.faults.fail():
+            if random() < 0.5:
+                # Drop the connection, no answer
+                self.close_connection = True
+                return
+            self.answer(503, "Service unavailable", "text/plain")
+            return
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        route = url.path[4:] if url.path.startswith("/api/") else url.path
+        try:
+            if route == "/frozenEdge":
+                height = self.chain.frozen_height()
+                self.answer(200, frozen_page(height, self.chain.block_hash(height),
+                                             self.chain.block_timestamp(height) + 7000))
+            elif route == "/balance":
+                identifier = raw_identifier(query.get("walletId", ""))
+                if not identifier:
+                    self.answer(200, error_page("Please provide a valid wallet identifier"))
+                else:
+                    balance = self.chain.balance(identifier) / 1e6
+                    self.answer(200, fake_table(["block height", "balance"],
+                                                [[self.chain.frozen_height(), f"∩{balance:0.6f}"]]))
+            elif route == "/forwardTransaction":
+                tx__ = query.get("transaction", "")
+                if not tx__.startswith("tx__") or len(tx__) < 100:
+                    self.answer(200, error_page("Please provide a valid transaction"))
+                else:
+                    height = self.chain.forward(tx__)
+                    self.answer(200, fake_table(["block height", "forwarded"], [[height, "true"]]))
+            elif route == "/transactionSearch":
+                height = self.chain.search(query.get("string", ""))
+                if height:
+                    self.answer(200, fake_table(["height", "status"], [[height, "frozen"]]))
+                else:
+                    self.answer(200, error_page("Transaction not found"))
+            elif route == "/fees":
+                self.answer_json([{"height": self.chain.frozen_height(), "issue_fees": 100000000,
+                                   "mint_fees": 1000000}])
+            elif route.startswith("/check_tx/"):
+                data = route.split("/", 5)[-1] if route.count("/") >= 5 else ""
+                if data[:3] not in ("TI:", "TM:", "TB:", "TT:", "TO:"):
+                    self.answer(200, "Error: unknown token operation", "text/plain")
+                else:
+                    self.answer(200, "Ok", "text/plain")
+            elif route.startswith("/balances/"):
+                identifier = raw_identifier(route[len("/balances/"):])
+                account = int.from_bytes(identifier, 'big') if identifier else self.chain.accounts
+                balances = {}
+                if account < self.chain.accounts:
+                    balances[TOKEN_NAME] = {"amount": str(account), "decimals": 0}
+                self.answer_json(balances)
+            else:
+                self.answer(404, "Not found", "text/plain")
+        except Exception as e:
+            self.answer(500, f"Error: {e}", "text/plain")
+
+    def answer(self, code: int, body: str, content_type: str="text/html; charset=utf-8") -> None:
+        data = body.encode('utf-8')
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def answer_json(self, data) -> None:
+        self.answer(200, json.dumps(data), "application/json")
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+def make_client_server(chain: MockChain, faults: Faults, host: str="127.0.0.1", port: int=8765,
+                       verbose: bool=False) -> ThreadingHTTPServer:
+    handler = type("Handler", (MockClientHandler, ), {"chain": chain, "faults": faults, "verbose": verbose})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
@@ -0,0 +1,24 @@
+"""
+Latency and failure injection, the same for both mock servers.
+"""
+
+from random import random, uniform
+from time import sleep
+
+
+class Faults:
+
+    def __init__(self, latency: float=0.0, jitter: float=0.0, failure_rate: float=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+
+    def delay(self) -> None:
+        """Sleeps latency plus a random part up to jitter"""
+        wait = self.latency + (uniform(0, self.jitter) if self.jitter else 0)
+        if wait > 0:
+            sleep(wait)
+
+    def fail(self) -> bool:
+        """True if this request is to fail"""
+        return self.failure_rate > 0 and random() < self.failure_rate
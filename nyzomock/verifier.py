@@ -0,0 +1,88 @@
+"""
+Mock Nyzo verifier, answers StatusRequest17 and BlockRequest11 on a TCP port.
+
+Same framing as a real verifier: 4 bytes length prefix, one message then the connection is closed.
+Answers are not signed, pynyzo does not validate them.
+"""
+
+import socketserver
+import struct
+from time import time
+
+from nyzomock.chain import MockChain
+from nyzomock.faults import Faults
+
+
+STATUS_REQUEST = 17
+STATUS_RESPONSE = 18
+BLOCK_REQUEST = 11
+BLOCK_RESPONSE = 12
+
+
+def envelope(message_type: int, content: bytes) -> bytes:
+    """timestamp, type, content, source identifier and signature"""
+    return struct.pack(">Qh", int(time() * 1000), message_type) + content + b'\x66' * 32 + b'\x77' * 64
+
+
+def strings_to_buffer(lines: list) -> bytes:
+    parts = [struct.pack(">B", len(lines))]
+    for line in lines:
+        data = line.encode('utf-8')
+        parts.append(struct.pack(">H", len(data)) + data)
+    return b''.join(parts)
+
+
+class MockVerifierHandler(socketserver.BaseRequestHandler):
+    # Set on the server class by make_verifier_server
+    chain = None
+    faults = None
+    nickname = "mock"
+    max_blocks = 10
+
+    def recv_exact(self, length: int) -> bytes:
+        chunks = []
+        while length > 0:
+            chunk = self.request.recv(min(length, 65536))
+            if not chunk:
+                raise ConnectionError("EOF")
+            chunks.append(chunk)
+            length -= len(chunk)
+        return b''.join(chunks)
+
+    def handle(self):
+        try:
+            length = struct.unpack(">I", self.recv_exact(4))[0] - 4
+            data = self.recv_exact(length)
+        except (ConnectionError, struct.error):
+            return
+        self.faults.delay()
+        if self.faults.fail():
+            # Close without answer
+            return
+        message_type = struct.unpack(">h", data[8:10])[0]
+        if message_type == STATUS_REQUEST:
+            message = envelope(STATUS_RESPONSE, strings_to_buffer(self.chain.status_lines(self.nickname)))
+        elif message_type == BLOCK_REQUEST:
+            start, end, with_balance_list = struct.unpack(">QQ?", data[10:27])
+            # Same as a real verifier, capped to the frozen edge and to max_blocks per answer
+            end = min(end, self.chain.frozen_height(), start + self.max_blocks - 1)
+            heights = range(start, end + 1)
+            content = b'\x01' + self.chain.balance_list_bytes(start) if with_balance_list else b'\x00'
+            content += struct.pack(">H", len(heights)) + b''.join(self.chain.block_bytes(h) for h in heights)
+            message = envelope(BLOCK_RESPONSE, content)
+        else:
+            return
+        self.request.sendall(struct.pack(">I", len(message) + 4) + message)
+
+
+class ThreadingVerifierServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def make_verifier_server(chain: MockChain, faults: Faults, host: str="127.0.0.1", port: int=9444,
+                         nickname: str="mock", max_blocks: int=10) -> ThreadingVerifierServer:
+    handler = type("Handler", (MockVerifierHandler, ), {"chain": chain, "faults": faults, "nickname": nickname,
+                                                        "max_blocks": max_blocks})
+    return ThreadingVerifierServer((host, port), handler)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Nyzocli offline benchmark suite
+
+Times the CPU bound parts of Nyzocli, no network needed:
+client page parsing, status lines, address handling, transaction assembly and encoding,
+signing throughput and balance list lookups.
+
+Run from the repo root:
+python3 utils/benchmarks.py > bench-0.0.12.json
+python3 utils/benchmarks.py --quick --compare bench-0.0.12.json
+python3 utils/benchmarks.py --filter sign
+
+Prints a json report. With --compare, every result also gets its ratio to the same benchmark of
+a previous report: above 1 is slower than before.
+"""
+
+import argparse
+import json
+import platform
+import sys
+from os import path, remove, urandom
+from tempfile import NamedTemporaryFile
+from time import perf_counter
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+import Nyzocli  # noqa: E402
+from fake_table_bench import synthetic_page  # noqa: E402
+from modules.helpers import extract_status_lines, fake_table_frozen_to_dict, fake_table_to_list, \
+    find_balance_item  # noqa: E402
+from modules.signing import SigningEngine, encode_standard, get_keys, standard_transaction  # noqa: E402
+from modules.snapshot import BalanceSnapshot, write_snapshot  # noqa: E402
+from nyzostrings.nyzostringencoder import NyzoStringEncoder  # noqa: E402
+from nyzostrings.nyzostringpublicidentifier import NyzoStringPublicIdentifier  # noqa: E402
+from pynyzo.balancelistitem import BalanceListItem  # noqa: E402
+
+
+FROZEN_PAGE = ('<html><body><div class="fake-table">'
+               '<div class="data-row"><div>height</div><div>8765432</div></div>'
+               '<div class="data-row"><div>hash</div><div class="extra-wrap">'
+               'a1b2c3d4e5f60718-a1b2c3d4e5f60718-a1b2c3d4e5f60718-a1b2c3d4e5f60718</div></div>'
+               '<div class="data-row"><div>verification timestamp (ms)</div><div>1600000000000</div></div>'
+               '<div class="data-row"><div>distance from open edge</div><div>2</div></div>'
+               '</div></div></body></html>')
+
+STATUS_LINES = ["nickname: Nyzo 0", "version: 587", "ID: b5fd...173b", "mesh: 1398 total, 527 in cycle",
+                "cycle length: 530", "transactions: 0", "retention edge: 1694074", "trailing edge: 1694098",
+                "frozen edge: 1696216 (Grimnoshtadrano)", "open edge: 1696217",
+                "blocks transmitted/created: 206/104847", "votes requested: 458237",
+                "- h: +1, n: 2, v: 79(79)", "requester identifier: abd7...4c9f"]
+
+
+def measure(function, min_time: float, repeats: int=3) -> dict:
+    """Calls function in a loop until min_time is spent, best of repeats. Returns time per call."""
+    iterations = 1
+    while True:
+        start = perf_counter()
+        for _ in range(iterations):
+            function()
+        elapsed = perf_counter() - start
+        if elapsed >= min_time / 5 or iterations >= 1 << 24:
+            break
+        iterations *= 4
+    iterations = max(1, int(iterations * (min_time / 5) / max(elapsed, 1e-9)))
+    best = None
+    for _ in range(repeats):
+        start = perf_counter()
+        for _ in range(iterations):
+            function()
+        per_call = (perf_counter() - start) / iterations
+        best = per_call if best is None else min(best, per_call)
+    return {"iterations": iterations, "per_call_us": round(best * 1e6, 3), "calls_per_sec": round(1 / best, 1)}
+
+
+def benchmarks(quick: bool) -> dict:
+    """name -> (function to time, items processed by one call)"""
+    rows = 30000 if not quick else 5000
+    page_small, page_big = synthetic_page(50), synthetic_page(rows)
+    seed = urandom(32)
+    key, address = get_keys(seed)
+    recipient = urandom(32).hex()
+    recipient_id = NyzoStringEncoder.encode(NyzoStringPublicIdentifier.from_hex(recipient))
+    frozen = {"height": 8765432, "hash": urandom(32).hex()}
+    transaction = standard_transaction(address, recipient, 12500000, "payout", frozen, 1600000000000)
+    payload = transaction.get_bytes(for_signing=True)
+    signature = key.sign(payload)
+    batch = [(0, payload)] * (2000 if quick else 10000)
+    engine = SigningEngine([seed], min_parallel=1)
+
+    identifiers = sorted(urandom(32) for _ in range(100000))
+    items = [BalanceListItem(identifier=identifier, balance=1000, blocks_until_fee=10) for identifier in identifiers]
+    lookups = [identifiers[i] for i in range(0, len(identifiers), 997)] + [urandom(32) for _ in range(100)]
+    with NamedTemporaryFile(delete=False, suffix=".bin") as fp:
+        snapshot_file = fp.name
+    write_snapshot(snapshot_file, 8765432, items)
+    snapshot = BalanceSnapshot(snapshot_file)
+
+    return {
+        "fake_table_to_list.page_50_rows": (lambda: fake_table_to_list(page_small), 50),
+        f"fake_table_to_list.page_{rows}_rows": (lambda: fake_table_to_list(page_big), rows),
+        "fake_table_frozen_to_dict": (lambda: fake_table_frozen_to_dict(FROZEN_PAGE), 1),
+        "extract_status_lines.frozen_edge": (lambda: extract_status_lines(STATUS_LINES, "frozen edge"), 1),
+        "normalize_address.hex": (lambda: Nyzocli.normalize_address(recipient, asHex=True), 1),
+        "normalize_address.id__": (lambda: Nyzocli.normalize_address(recipient_id, asHex=True), 1),
+        "transaction.assemble": (lambda: standard_transaction(address, recipient, 12500000, "payout", frozen,
+                                                              1600000000000).get_bytes(for_signing=True), 1),
+        "transaction.encode_tx__": (lambda: encode_standard(address, recipient, 12500000, "payout", frozen,
+                                                            1600000000000, signature), 1),
+        "sign.single": (lambda: key.sign(payload), 1),
+        "sign.derive_keys_uncached": (lambda: get_keys.__wrapped__(seed), 1),
+        f"sign.engine_{engine.workers}_processes": (lambda: engine.sign(batch), len(batch)),
+        "balance_list.find_item": (lambda: [find_balance_item(items, identifier) for identifier in lookups],
+                                   len(lookups)),
+        "balance_list.snapshot_find": (lambda: [snapshot.find(identifier) for identifier in lookups], len(lookups)),
+    }, lambda: (engine.close(), snapshot.close(), remove(snapshot_file))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Nyzocli offline benchmarks")
+    parser.add_argument("--quick", action="store_true", help="Smaller inputs and shorter runs")
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--min_time", type=float, default=None, help="Seconds spent per benchmark (default 1, 0.2 quick)")
+    parser.add_argument("--compare", type=argparse.FileType("r"), default=None,
+                        help="Previous json report to compare against")
+    options = parser.parse_args()
+    min_time = options.min_time or (0.2 if options.quick else 1.0)
+    baseline = {}
+    if options.compare:
+        baseline = {result["name"]: result for result in json.load(options.compare)["results"]}
+    suite, cleanup = benchmarks(options.quick)
+    results = []
+    try:
+        for name, (function, items) in suite.items():
+            if options.filter not in name:
+                continue
+            result = {"name": name, "items_per_call": items, **measure(function, min_time)}
+            result["items_per_sec"] = round(result["calls_per_sec"] * items, 1)
+            if name in baseline:
+                result["ratio"] = round(result["per_call_us"] / baseline[name]["per_call_us"], 3)
+            results.append(result)
+            print(f"{name}: {result['per_call_us']} us", file=sys.stderr)
+    finally:
+        cleanup()
+    print(json.dumps({"nyzocli": Nyzocli.__version__, "python": platform.python_version(),
+                      "platform": platform.platform(), "quick": options.quick, "results": results}, indent=2))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Client "fake table" parser benchmark
+
+Times modules.helpers.fake_table_to_list on synthetic client pages, from the one row balance page to large ones,
+against the former regex/split implementation, kept here as a reference.
+
+Run from the repo root:
+python3 utils/fake_table_bench.py
+python3 utils/fake_table_bench.py --rows 1000 10000 50000 --runs 5
+
+Prints a json report, one entry per page size.
+"""
+
+import argparse
+import json
+import re
+import sys
+from os import path
+from statistics import median
+from time import perf_counter
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from modules.helpers import fake_table_to_list, iter_fake_table  # noqa: E402
+
+
+HEADERS = ["block height", "identifier", "balance", "blocks until fee"]
+
+
+def synthetic_page(rows: int) -> str:
+    """A client page with one header row and rows data rows, same markup as the client web UI"""
+    parts = ['<html><body><div class="fake-table"><div class="header-row">']
+    parts.extend(f'<div>{header}</div>' for header in HEADERS)
+    parts.append('</div>')
+    for i in range(rows):
+        parts.append(f'<div class="data-row"><div>{1000000 + i}</div>'
+                     f'<div class="extra-wrap">{i:016x}-{i:016x}-{i:016x}-{i:016x}</div>'
+                     f'<div>&cap;{i}.000001</div><div>{i % 500}</div></div>')
+    parts.append('</div></div></body></html>')
+    return ''.join(parts)
+
+
+def legacy_fake_table_to_list(html: str):
+    """Former implementation: chained replaces, greedy regexes, list re-slicing for every row"""
+    test_header = re.search(r'<div class="header-row">([^"]*)</div><div class="data-row">', html)
+    headers = []
+    if test_header:
+        headers = test_header.groups()[0].replace('<div>', '').split("</div>")[:-1]
+    test_content = re.search(r'<div class="data-row">(.*)</div></div></div>', html)
+    values = []
+    if test_content:
+        content = test_content.groups()[0].replace('<div>', '') \
+            .replace('<div class="extra-wrap">', '') \
+            .replace('<div class="data-row">', '') \
+            .split("</div>")
+        while len(content) >= len(headers):
+            part = content[0:len(headers)]
+            content = content[len(headers)+1:]
+            values.append(dict(zip(headers, part)))
+    return values
+
+
+def timed(function, html: str, runs: int) -> float:
+    """Median seconds per call. Small pages are parsed in loops, so each measure lasts some ms"""
+    number = max(1, 200000 // len(html))
+    times = []
+    for _ in range(runs):
+        start = perf_counter()
+        for _ in range(number):
+            function(html)
+        times.append((perf_counter() - start) / number)
+    return round(median(times), 7)
+
+
+def first_row(html: str):
+    return next(iter_fake_table(chunk for chunk in (html[i:i + 65536] for i in range(0, len(html), 65536))))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake table parser benchmark")
+    parser.add_argument("--rows", type=int, nargs="*", default=[1, 50, 100, 1000, 10000, 30000], help="Page sizes, in rows")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per measure, the median is reported")
+    parser.add_argument("--no_legacy", action="store_true", help="Skip the former implementation (slow on big pages)")
+    options = parser.parse_args()
+    report = []
+    for rows in options.rows:
+        html = synthetic_page(rows)
+        assert len(fake_table_to_list(html)) == rows
+        entry = {"rows": rows, "page_bytes": len(html),
+                 "parser": timed(fake_table_to_list, html, options.runs),
+                 "first_row_streamed": timed(first_row, html, options.runs)}
+        if not options.no_legacy:
+            entry["legacy"] = timed(legacy_fake_table_to_list, html, options.runs)
+            entry["speedup"] = round(entry["legacy"] / entry["parser"], 2) if entry["parser"] else None
+        report.append(entry)
+    print(json.dumps(report, indent=2))
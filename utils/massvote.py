@@ -18,6 +18,10 @@ For ncfp3, you can get and rename the ncfp3-sigs.txt from open nyzo github to vo
 - run massvote.py
 - you'll get a "vote.sh" script you can then chmod +x and run. This will run the Nyzocli with all needed votes, randomized and with random wait in between.
 
+Or run massvote.py --run to have it vote itself, in a single process: keys are derived once,
+votes are signed locally and forwarded through one keep-alive http session.
+Progress is saved in massvote_state.json after every vote, run again with --run to resume after an interruption.
+Once the plan is done, votes that do not show on nyzo.today are sent again (RECHECKS rounds).
 """
 
 # You can adjust here to your liking. wait will be random between these two.
@@ -30,16 +34,39 @@ MAX_WAIT_BETWEEN_VOTE = 900
 # With ASK_NYZO_TODAY = True, you can re-run the script after a first pass to check and re-submit missing votes.
 ASK_NYZO_TODAY = True
 
+# --run mode: client to forward the votes to
+CLIENT = "https://client.nyzo.co"
+# --run mode: seconds to wait before checking the votes landed on nyzo.today, and max resubmit rounds.
+RECHECK_DELAY = 600
+RECHECKS = 3
+
+# nyzo.today lookups: concurrent requests, and seconds a cached vote list stays valid.
+LOOKUP_WORKERS = 8
+LOOKUP_CACHE_TTL = 900
+
 # ----==---- You should not need to edit below ----==----
 
+import argparse
 import json
-# import sys
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from os import path
 from random import shuffle, randint
-from requests import get
+from time import time, sleep
+
 from nyzostrings.nyzostringencoder import NyzoStringEncoder
 from pynyzo.keyutil import KeyUtil
 
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from modules.helpers import atomic_write, fake_table_to_list  # noqa: E402
+from modules.signing import derive_keys, sign_vote, vote_timestamp  # noqa: E402
+from modules.transport import HttpTransport  # noqa: E402
+
+
+STATE_FILE = "massvote_state.json"
+LOOKUP_CACHE_FILE = "nyzo_today_votes.json"
+
 
 def read_sig_vote(line):
     line = line.strip().split(' ')
@@ -52,7 +79,170 @@ def read_sig_vote(line):
 VOTED = {}
 
 
+def get_votes(http: HttpTransport, sig_: str) -> dict:
+    """Votes nyzo.today knows for a cycle tx sig_, by voter id as hex"""
+    hex_sig = NyzoStringEncoder.decode(sig_).get_bytes().hex()
+    res = http.get(f"https://nyzo.today/api/transactionvotes/{hex_sig}")
+    return json.loads(res.text)
+
+
+def save_json(file_name: str, data: dict) -> None:
+    """Atomic write, a kill never leaves a partial file"""
+    with atomic_write(file_name) as fp:
+        json.dump(data, fp, indent=1)
+
+
+def save_state(state: dict) -> None:
+    save_json(STATE_FILE, state)
+
+
+def fetch_votes(http: HttpTransport, sig_list: list, ids: list, ttl: float=LOOKUP_CACHE_TTL) -> dict:
+    """Votes nyzo.today knows for every sig_, {sig_: {id_hex: ...}}.
+    Answers from the disk cache when fetched less than ttl seconds ago, queries the others LOOKUP_WORKERS at a time.
+    Once all our ids voted for a sig, its votes can't change anymore for us: that cache entry never expires.
+    A failed lookup does not stop the others: that sig is left out of the answer, the rest is cached all the same."""
+    cache = {}
+    if path.isfile(LOOKUP_CACHE_FILE):
+        try:
+            with open(LOOKUP_CACHE_FILE) as fp:
+                cache = json.load(fp)
+        except Exception:
+            cache = {}
+    now = time()
+    to_fetch = []
+    for sig_ in set(sig_list):
+        entry = cache.get(sig_)
+        if entry and (now - entry["fetched_at"] < ttl or all(id_hex in entry["votes"] for id_hex in ids)):
+            continue
+        to_fetch.append(sig_)
+    failed = set()
+
+    def lookup(sig_: str):
+        try:
+            return get_votes(http, sig_)
+        except Exception as e:
+            print(f"nyzo.today lookup failed for {sig_[:16]}...: {e}")
+            return None
+
+    if to_fetch:
+        print(f"Asking nyzo.today for {len(to_fetch)} sigs, {len(set(sig_list)) - len(to_fetch)} from cache")
+        with ThreadPoolExecutor(max_workers=LOOKUP_WORKERS) as executor:
+            for sig_, votes in zip(to_fetch, executor.map(lookup, to_fetch)):
+                if votes is None:
+                    failed.add(sig_)
+                    continue
+                cache[sig_] = {"fetched_at": now, "votes": votes}
+        save_json(LOOKUP_CACHE_FILE, cache)
+    return {sig_: cache[sig_]["votes"] for sig_ in sig_list if sig_ in cache and sig_ not in failed}
+
+
+def new_state(plan: list) -> dict:
+    """Vote plan: one entry per sig x key id, in random order. Private keys never go to the state file."""
+    votes = [{"sig": sig[0], "vote": int(sig[1]), "id": id_hex, "status": "pending", "tries": 0}
+             for sig, id_hex in plan]
+    return {"created": int(time()), "rechecks": 0, "votes": votes}
+
+
+def run_plan(state: dict, signers: dict, http: HttpTransport, client: str) -> None:
+    """Sends every pending vote of the plan, with random waits in between. Saves progress after each vote."""
+    first = True
+    for item in state["votes"]:
+        # Failed ones are retried when resuming
+        if item["status"] not in ("pending", "failed"):
+            continue
+        if item["id"] not in signers:
+            item["status"] = "skipped"
+            save_state(state)
+            continue
+        if not first:
+            delay = randint(MIN_WAIT_BETWEEN_VOTE, MAX_WAIT_BETWEEN_VOTE)
+            print(f"Waiting {delay} sec")
+            sleep(delay)
+        first = False
+        key, address = signers[item["id"]]
+        _, tx__ = sign_vote(key, address, item["sig"], item["vote"], vote_timestamp(time()))
+        item["tries"] += 1
+        item["last_sent"] = int(time())
+        try:
+            res = http.get(f"{client}/forwardTransaction?transaction={tx__}&action=run")
+            answer = fake_table_to_list(res.text)
+            forwarded = any(str(row.get("forwarded")).lower() == "true" for row in answer)
+            item["result"] = answer
+        except Exception as e:
+            forwarded = False
+            item["result"] = [{"error": str(e)}]
+        item["status"] = "forwarded" if forwarded else "failed"
+        save_state(state)
+        print(f"Vote {item['vote']} for {item['sig'][:16]}... by {item['id'][:8]}: {item['status']}")
+
+
+def recheck(state: dict, http: HttpTransport) -> int:
+    """Marks votes seen on nyzo.today as confirmed, sends the missing or failed ones back to pending.
+    Forwarded votes nyzo.today could not be asked about are left as they are, for the next recheck.
+    Returns the number of votes still to confirm."""
+    sent = [item for item in state["votes"] if item["status"] in ("forwarded", "failed")]
+    # Fresh lists, but sigs all our ids are known to have voted for are not asked again
+    votes = fetch_votes(http, [item["sig"] for item in sent], list({item["id"] for item in state["votes"]}), ttl=0)
+    missing = 0
+    for item in sent:
+        if item["sig"] not in votes and item["status"] == "forwarded":
+            missing += 1
+        elif item["id"] in votes.get(item["sig"], {}):
+            item["status"] = "confirmed"
+        else:
+            item["status"] = "pending"
+            missing += 1
+    state["rechecks"] += 1
+    save_state(state)
+    return missing
+
+
+def scheduler(keys: list, sigs: list, client: str) -> None:
+    """--run mode: the whole vote plan, in this process"""
+    http = HttpTransport()
+    # Derive once, for all the votes
+    signers = {}
+    for key_ in keys:
+        key, id_hex = derive_keys(key_)
+        signers[id_hex] = (key, id_hex)
+    if path.isfile(STATE_FILE):
+        with open(STATE_FILE) as fp:
+            state = json.load(fp)
+        print(f"Resuming from {STATE_FILE}")
+    else:
+        if ASK_NYZO_TODAY:
+            VOTED.update(fetch_votes(http, [sig[0] for sig in sigs], list(signers)))
+        else:
+            VOTED.update({sig[0]: {} for sig in sigs})
+        # A sig nyzo.today could not be asked about gets all the votes
+        plan = [(sig, id_hex) for id_hex in signers for sig in sigs if id_hex not in VOTED.get(sig[0], {})]
+        shuffle(plan)
+        state = new_state(plan)
+        save_state(state)
+    while True:
+        pending = sum(1 for item in state["votes"] if item["status"] == "pending")
+        estimate = ((MIN_WAIT_BETWEEN_VOTE + MAX_WAIT_BETWEEN_VOTE) / 2 + 3) * pending / 60
+        print(f"{pending} votes to send. Estimated time {estimate} min")
+        run_plan(state, signers, http, client)
+        if not ASK_NYZO_TODAY or state["rechecks"] >= RECHECKS:
+            break
+        print(f"Waiting {RECHECK_DELAY} sec before checking votes on nyzo.today")
+        sleep(RECHECK_DELAY)
+        if recheck(state, http) == 0:
+            break
+    counts = {}
+    for item in state["votes"]:
+        counts[item["status"]] = counts.get(item["status"], 0) + 1
+    print(f"Done: {json.dumps(counts)}. Delete {STATE_FILE} before voting a new sigs.txt.")
+    http.close()
+
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Mass voter helper")
+    parser.add_argument("--run", action="store_true",
+                        help="Vote from this process, with saved progress, instead of writing vote.sh")
+    parser.add_argument("--client", default=CLIENT, help="Client to forward the votes to (--run mode)")
+    options = parser.parse_args()
     if not path.isfile("keys.txt"):
         print("missing keys.txt file")
         exit()
@@ -65,14 +255,15 @@ if __name__ == '__main__':
     with open("sigs.txt") as fp:
         sigs = fp.readlines()
         sigs = [read_sig_vote(line) for line in sigs if line.strip() != '']
-    for sig in sigs:
-        if ASK_NYZO_TODAY:
-            hex_sig = NyzoStringEncoder.decode(sig[0]).get_bytes().hex()
-            res = get(f"https://nyzo.today/api/transactionvotes/{hex_sig}")
-            VOTED[sig[0]] = json.loads(res.text)
-        else:
-            VOTED[sig[0]] = {}
-
+    if options.run:
+        scheduler(keys, sigs, options.client)
+        exit()
+    http = HttpTransport()
+    if ASK_NYZO_TODAY:
+        ids = [KeyUtil.private_to_public(NyzoStringEncoder.decode(key).get_bytes().hex()) for key in keys]
+        VOTED.update(fetch_votes(http, [sig[0] for sig in sigs], ids))
+    else:
+        VOTED.update({sig[0]: {} for sig in sigs})
     total_pre = len(sigs) * len(keys)
     estimate = ((MIN_WAIT_BETWEEN_VOTE + MAX_WAIT_BETWEEN_VOTE) / 2 + 3) * total_pre / 60
     print("{} keys and {} sigs, total {} votes.\nEstimated time {} min"
@@ -83,7 +274,7 @@ if __name__ == '__main__':
         # calc matching id as hex
         id_hex = KeyUtil.private_to_public(key_hex)
         for sig in sigs:
-            if id_hex not in VOTED[sig[0]]:
+            if id_hex not in VOTED.get(sig[0], {}):
                 total.append((sig, key))
     shuffle(total)
     estimate = ((MIN_WAIT_BETWEEN_VOTE + MAX_WAIT_BETWEEN_VOTE) / 2 + 3) * len(total) / 60
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Nyzocli startup benchmark
+
+Measures how long Nyzocli takes to start for offline safe commands,
+and which modules each command drags in at import time (python -X importtime).
+
+Run from the repo root:
+python3 utils/startup_bench.py
+python3 utils/startup_bench.py --runs 20 --top 10 version info "send --help"
+
+Prints a json report, one entry per command.
+"""
+
+import argparse
+import json
+import shlex
+import subprocess
+import sys
+from os import environ, path
+from statistics import median
+from time import perf_counter
+
+
+NYZOCLI = path.join(path.dirname(path.dirname(path.abspath(__file__))), "Nyzocli.py")
+
+DEFAULT_COMMANDS = ["version", "--help", "send --help", "blocks --help", "token --help", "info"]
+
+# Modules the fast path is supposed to avoid
+HEAVY_MODULES = ["requests", "tornado", "pynyzo.connection", "pynyzo.clienthelpers", "nyzostrings.nyzostringencoder"]
+
+
+def run(args: list, importtime: bool=False) -> subprocess.CompletedProcess:
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ["-X", "importtime"]
+    env = dict(environ)
+    # Always measure the local path, not a serve process
+    env.pop("NYZOCLI_SOCKET", None)
+    return subprocess.run(cmd + [NYZOCLI] + args, capture_output=True, text=True, env=env)
+
+
+def parse_importtime(stderr: str) -> dict:
+    """Module -> (self us, cumulative us) from -X importtime output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def bench_command(command: str, runs: int, top: int) -> dict:
+    args = shlex.split(command)
+    walls = []
+    for _ in range(runs):
+        start = perf_counter()
+        result = run(args)
+        walls.append(perf_counter() - start)
+    modules = parse_importtime(run(args, importtime=True).stderr)
+    slowest = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    return {"command": command,
+            "exit_code": result.returncode,
+            "wall_min": round(min(walls), 4),
+            "wall_median": round(median(walls), 4),
+            "modules": len(modules),
+            "import_total": round(sum(self_us for self_us, _ in modules.values()) / 1e6, 4),
+            "heavy_loaded": [name for name in HEAVY_MODULES if name in modules],
+            "slowest_imports": [{"module": name, "self": round(self_us / 1e6, 4),
+                                 "cumulative": round(cumulative_us / 1e6, 4)}
+                                for name, (self_us, cumulative_us) in slowest]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Nyzocli startup benchmark")
+    parser.add_argument("commands", nargs="*", default=DEFAULT_COMMANDS, help="Nyzocli command lines to time")
+    parser.add_argument("--runs", type=int, default=10, help="Timed runs per command")
+    parser.add_argument("--top", type=int, default=5, help="Slowest imports to list per command")
+    options = parser.parse_args()
+    # Interpreter alone, as a baseline
+    start = perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"])
+    report = {"python": sys.version.split()[0],
+              "interpreter_startup": round(perf_counter() - start, 4),
+              "commands": [bench_command(command, options.runs, options.top) for command in options.commands]}
+    print(json.dumps(report, indent=2))